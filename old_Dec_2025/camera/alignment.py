@@ -0,0 +1,87 @@
+# camera/alignment.py
+#
+# ArcFace 5-point alignment for many faces at once.
+#
+# The similarity transform (rotation + uniform scale + translation) onto the
+# ArcFace reference points has a closed-form least-squares solution
+# (Umeyama); for 2D it needs no SVD, so all N faces are solved with a few
+# vectorized reductions instead of one RANSAC fit per face. Crops are warped
+# straight into a preallocated (N, 112, 112, 3) batch for the recognizer.
+
+import cv2
+import numpy as np
+
+# ArcFace reference 5 points in a 112x112 crop
+# (left eye, right eye, nose, mouth left, mouth right)
+ARCFACE_REF = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float32)
+
+
+def similarity_transforms(landmarks, ref=ARCFACE_REF):
+    """
+    landmarks: (n, 5, 2) points in the frame (or (5, 2) for one face)
+    return: (M (n, 2, 3) float32 frame -> crop matrices, valid (n,) bool)
+    """
+    src = np.asarray(landmarks, dtype=np.float64).reshape(-1, len(ref), 2)
+    dst = np.asarray(ref, dtype=np.float64)
+
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean(axis=0)
+    s = src - src_mean
+    d = dst - dst_mean
+
+    # scale * [cos, sin] minimizing sum |a * R s + t - d|^2
+    norm = (s ** 2).sum(axis=(1, 2))
+    valid = norm > 1e-6
+    norm = np.where(valid, norm, 1.0)
+    a = (s[:, :, 0] * d[:, 0] + s[:, :, 1] * d[:, 1]).sum(axis=1) / norm
+    b = (s[:, :, 0] * d[:, 1] - s[:, :, 1] * d[:, 0]).sum(axis=1) / norm
+
+    M = np.empty((len(src), 2, 3), dtype=np.float64)
+    M[:, 0, 0], M[:, 0, 1] = a, -b
+    M[:, 1, 0], M[:, 1, 1] = b, a
+    M[:, :, 2] = dst_mean - np.einsum("nij,nj->ni", M[:, :, :2], src_mean[:, 0])
+    return M.astype(np.float32), valid
+
+
+class FaceAligner:
+    def __init__(self, max_faces=16, size=112, ref=ARCFACE_REF):
+        """
+        max_faces: batch capacity (grows if a frame has more faces)
+        size:      crop side; the reference points are scaled from 112
+        """
+        self.size = size
+        self.ref = np.asarray(ref, dtype=np.float32) * (size / 112.0)
+        self.batch = np.zeros((max_faces, size, size, 3), dtype=np.uint8)
+
+    def align(self, img, landmarks):
+        """
+        img:       BGR frame
+        landmarks: (n, 5, 2) points in `img`
+        return: ((n, size, size, 3) view into the batch, valid (n,) bool),
+                valid until the next call; invalid rows are black
+        """
+        M, valid = similarity_transforms(landmarks, self.ref)
+        n = len(M)
+        if n > len(self.batch):
+            self.batch = np.zeros((n, self.size, self.size, 3), dtype=np.uint8)
+
+        for i in range(n):
+            if valid[i]:
+                cv2.warpAffine(img, M[i], (self.size, self.size), dst=self.batch[i], borderValue=0.0)
+            else:
+                self.batch[i] = 0
+        return self.batch[:n], valid
+
+
+def align_face(img, landmarks_5):
+    """ArcFace 스타일 얼굴 정렬 (112x112), None if the points are degenerate"""
+    M, valid = similarity_transforms(landmarks_5)
+    if not valid[0]:
+        return None
+    return cv2.warpAffine(img, M[0], (112, 112), borderValue=0.0)
@@ -0,0 +1,216 @@
+# camera/ann_index.py
+
+import numpy as np
+
+from gallery import MatchMixin, l2_normalize
+
+
+def spherical_kmeans(vecs, n_clusters, n_iter=10, seed=0):
+    """
+    k-means on L2-normalized vectors (cosine distance).
+    vecs: (n, d) normalized float32
+    return: (n_clusters, d) normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vecs))
+    centroids = vecs[rng.choice(len(vecs), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = np.argmax(vecs @ centroids.T, axis=1)
+
+        counts = np.bincount(assign, minlength=n_clusters)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(vecs[order], starts[nonempty], axis=0)
+
+        # Re-seed empty clusters with random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vecs[rng.choice(len(vecs), int(empty.sum()), replace=False)]
+
+        centroids = l2_normalize(sums)
+
+    return centroids
+
+
+class IVFIndex(MatchMixin):
+    """
+    Inverted-file ANN index over L2-normalized embeddings (CPU only).
+
+    Vectors are bucketed by their nearest coarse k-means centroid. A query
+    only scans the `nprobe` closest buckets, so `nprobe` is the
+    recall/latency knob: nprobe == nlist is an exact search.
+
+    Same add/remove/search/match API as EmbeddingGallery.
+    """
+
+    def __init__(self, dim, nlist=256, nprobe=8):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self.size = 0
+
+        self.list_vecs = []    # per bucket: (capacity, d) float32
+        self.list_names = []   # per bucket: (capacity,) object
+        self.list_sizes = None
+        self.index = {}        # name -> (bucket, row)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, name):
+        return name in self.index
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    # -------------------------------------------
+    # Training
+    # -------------------------------------------
+    def train(self, vecs, n_iter=10, seed=0, max_points_per_list=64):
+        """Fit the coarse centroids on a sample of embeddings (clears the index)."""
+        if len(vecs) == 0:
+            raise ValueError("IVFIndex needs at least one vector to train on.")
+        vecs = l2_normalize(vecs)
+        max_points = self.nlist * max_points_per_list
+        if len(vecs) > max_points:
+            rng = np.random.default_rng(seed)
+            vecs = vecs[rng.choice(len(vecs), max_points, replace=False)]
+
+        self.centroids = spherical_kmeans(vecs, self.nlist, n_iter=n_iter, seed=seed)
+        self.nlist = len(self.centroids)
+
+        self.list_vecs = [np.zeros((16, self.dim), dtype=np.float32) for _ in range(self.nlist)]
+        self.list_names = [np.empty(16, dtype=object) for _ in range(self.nlist)]
+        self.list_sizes = np.zeros(self.nlist, dtype=np.int64)
+        self.index = {}
+        self.size = 0
+
+    @classmethod
+    def from_gallery(cls, gallery, nlist=256, nprobe=8):
+        """
+        Build a trained index holding every identity of an EmbeddingGallery or
+        GalleryFile (an empty gallery gives an empty, untrained index).
+        """
+        ivf = cls(gallery.dim, nlist=nlist, nprobe=nprobe)
+        if len(gallery) == 0:
+            return ivf
+        vecs = gallery.vecs[:gallery.size]
+        names = gallery.names() if callable(gallery.names) else gallery.names[:gallery.size]
+        ivf.train(vecs)
+        ivf.add_many(names, vecs)
+        return ivf
+
+    # -------------------------------------------
+    # Enrollment
+    # -------------------------------------------
+    def _append(self, bucket, name, vec):
+        n = self.list_sizes[bucket]
+        if n == len(self.list_vecs[bucket]):
+            vecs = np.zeros((2 * n, self.dim), dtype=np.float32)
+            vecs[:n] = self.list_vecs[bucket]
+            names = np.empty(2 * n, dtype=object)
+            names[:n] = self.list_names[bucket]
+            self.list_vecs[bucket] = vecs
+            self.list_names[bucket] = names
+
+        self.list_vecs[bucket][n] = vec
+        self.list_names[bucket][n] = name
+        self.list_sizes[bucket] = n + 1
+        self.index[name] = (bucket, n)
+        self.size += 1
+
+    def add_many(self, names, vecs):
+        """Enroll a batch; coarse assignment is one matrix product."""
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before adding vectors.")
+
+        vecs = l2_normalize(vecs)
+        buckets = np.argmax(vecs @ self.centroids.T, axis=1)
+        for name, vec, bucket in zip(names, vecs, buckets):
+            self.remove(name)
+            self._append(bucket, name, vec)
+
+    def add(self, name, emb):
+        self.add_many([name], np.atleast_2d(emb))
+
+    def remove(self, name):
+        pos = self.index.pop(name, None)
+        if pos is None:
+            return False
+
+        bucket, row = pos
+        last = self.list_sizes[bucket] - 1
+        vecs = self.list_vecs[bucket]
+        names = self.list_names[bucket]
+        if row != last:
+            vecs[row] = vecs[last]
+            names[row] = names[last]
+            self.index[names[row]] = (bucket, row)
+
+        names[last] = None
+        self.list_sizes[bucket] = last
+        self.size -= 1
+        return True
+
+    # -------------------------------------------
+    # Search
+    # -------------------------------------------
+    def _search_one(self, q, probes, k):
+        sims = []
+        names = []
+        for bucket in probes:
+            n = self.list_sizes[bucket]
+            if n:
+                sims.append(self.list_vecs[bucket][:n] @ q)
+                names.append(self.list_names[bucket][:n])
+
+        if not sims:
+            return np.empty(0, dtype=object), np.empty(0, dtype=np.float32)
+
+        sims = np.concatenate(sims)
+        names = np.concatenate(names)
+        kk = min(k, len(sims))
+        top = np.argpartition(-sims, kk - 1)[:kk]
+        top = top[np.argsort(-sims[top])]
+        return names[top], sims[top]
+
+    def search(self, query, k=1, nprobe=None):
+        """
+        query: (d,) or (n, d) embeddings
+        return: (names, scores) best first, shaped (k,) for a single query or
+                (n, k) for a batch like EmbeddingGallery.search; when the
+                probed buckets hold fewer than k vectors the rest is padded
+                with name None / score -inf
+        """
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before searching.")
+
+        q = l2_normalize(query)
+        single = q.ndim == 1
+        q = np.atleast_2d(q)
+
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse = q @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist), coarse.shape)
+
+        k = min(k, self.size)
+        names = np.full((len(q), k), None, dtype=object)
+        scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        if k:
+            for i, (qi, pi) in enumerate(zip(q, probes)):
+                n, sims = self._search_one(qi, pi, k)
+                names[i, :len(n)] = n
+                scores[i, :len(sims)] = sims
+
+        if single:
+            return names[0], scores[0]
+        return names, scores
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# camera/bench_alignment.py
+# Per-frame alignment cost: per-face RANSAC (estimateAffinePartial2D) vs batched closed form
+
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from alignment import ARCFACE_REF, FaceAligner, similarity_transforms
+
+
+def per_frame_ms(fn, repeat):
+    fn()  # warmup
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def random_faces(rng, n, w, h):
+    """ArcFace points under random similarity transforms (+0.5 px noise) -> (n, 5, 2)."""
+    angle = rng.uniform(-0.5, 0.5, n)
+    scale = rng.uniform(0.5, 3.0, n)
+    rot = np.stack([np.cos(angle), -np.sin(angle), np.sin(angle), np.cos(angle)], axis=1)
+    rot = rot.reshape(n, 2, 2) * scale[:, None, None]
+    offset = np.stack([rng.uniform(0, w - 400, n), rng.uniform(0, h - 400, n)], axis=1)
+    pts = np.einsum("nij,kj->nki", rot, ARCFACE_REF) + offset[:, None]
+    return (pts + rng.normal(0, 0.5, pts.shape)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face alignment benchmark")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    aligner = FaceAligner(max_faces=max(args.faces))
+
+    print(f"[INFO] Frame: {args.width}x{args.height}, 112x112 crops")
+    print("=" * 78)
+    print(f"{'faces':>6}{'RANSAC fit ms':>16}{'batch fit ms':>15}{'RANSAC+warp ms':>18}{'batch+warp ms':>17}"
+          f"{'max |dM|':>10}")
+    print("-" * 78)
+    for n in args.faces:
+        lms = random_faces(rng, n, args.width, args.height)
+
+        def ransac_fit():
+            return [cv2.estimateAffinePartial2D(lm, ARCFACE_REF)[0] for lm in lms]
+
+        def ransac_align():
+            return [cv2.warpAffine(img, M, (112, 112), borderValue=0.0) for M in ransac_fit()]
+
+        def batch_fit():
+            return similarity_transforms(lms)
+
+        def batch_align():
+            return aligner.align(img, lms)
+
+        diff = np.abs(np.stack(ransac_fit()) - batch_fit()[0]).max()
+        print(f"{n:>6}{per_frame_ms(ransac_fit, args.repeat):>16.3f}{per_frame_ms(batch_fit, args.repeat):>15.3f}"
+              f"{per_frame_ms(ransac_align, args.repeat):>18.3f}{per_frame_ms(batch_align, args.repeat):>17.3f}"
+              f"{diff:>10.4f}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# camera/bench_ann.py
+# IVF ANN index vs exact gallery search: recall@1 and queries/sec
+
+import time
+import argparse
+import numpy as np
+
+from gallery import EmbeddingGallery, l2_normalize
+from ann_index import IVFIndex
+
+
+def make_dataset(n_ids, n_queries, dim, n_groups, spread, noise, seed=0):
+    """
+    Synthetic ArcFace-like data: identities scattered around a few hundred
+    group centers, queries = enrolled identity + per-capture noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_groups, dim)).astype(np.float32)
+    ids = centers[rng.integers(0, n_groups, n_ids)]
+    ids += rng.normal(scale=spread, size=(n_ids, dim)).astype(np.float32)
+    ids = l2_normalize(ids)
+
+    truth = rng.integers(0, n_ids, n_queries)
+    queries = ids[truth] + rng.normal(scale=noise / np.sqrt(dim), size=(n_queries, dim)).astype(np.float32)
+    return ids, l2_normalize(queries)
+
+
+def timed(fn, queries, batch):
+    start = time.perf_counter()
+    names = []
+    for i in range(0, len(queries), batch):
+        n, _ = fn(queries[i:i + batch])
+        names.extend(x[0] if len(x) else None for x in n)
+    elapsed = time.perf_counter() - start
+    return names, len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN (IVF) vs exact embedding search benchmark")
+    parser.add_argument("--ids", type=int, default=100000, help="Enrolled identities")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--groups", type=int, default=500, help="Latent clusters in synthetic data")
+    parser.add_argument("--spread", type=float, default=2.0, help="Identity spread around its group center")
+    parser.add_argument("--noise", type=float, default=1.0, help="Query noise (relative norm)")
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--batch", type=int, default=1, help="Queries per search call")
+    args = parser.parse_args()
+
+    print(f"[INFO] Building dataset: {args.ids} ids x {args.dim}-dim, {args.queries} queries")
+    ids, queries = make_dataset(args.ids, args.queries, args.dim, args.groups, args.spread, args.noise)
+    names = [f"id{i}" for i in range(args.ids)]
+
+    gallery = EmbeddingGallery(args.dim, capacity=args.ids)
+    for name, vec in zip(names, ids):
+        gallery.add(name, vec)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.from_gallery(gallery, nlist=args.nlist)
+    print(f"[INFO] IVF build (nlist={ivf.nlist}): {time.perf_counter() - start:.2f}s")
+
+    exact, exact_qps = timed(lambda q: gallery.search(q, k=1), queries, args.batch)
+
+    print("=" * 60)
+    print(f"{'method':<20}{'recall@1':>12}{'queries/sec':>16}")
+    print("-" * 60)
+    print(f"{'exact':<20}{1.0:>12.4f}{exact_qps:>16.1f}")
+
+    for nprobe in args.nprobe:
+        approx, qps = timed(lambda q: ivf.search(q, k=1, nprobe=nprobe), queries, args.batch)
+        recall = np.mean([a == e for a, e in zip(approx, exact)])
+        print(f"{'ivf nprobe=' + str(nprobe):<20}{recall:>12.4f}{qps:>16.1f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# camera/bench_batch_match.py
+# Per-frame matching cost: one search per face vs one batched search per frame
+
+import time
+import argparse
+import numpy as np
+
+from gallery import EmbeddingGallery
+
+
+def per_frame_ms(fn, embs, repeat):
+    fn(embs)  # warmup
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(embs)
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched vs per-face gallery matching benchmark")
+    parser.add_argument("--ids", type=int, default=5000, help="Enrolled identities")
+    parser.add_argument("--dim", type=int, default=512, help="512 = ArcFace, 1434 = Mediapipe landmarks")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    gallery = EmbeddingGallery(args.dim, capacity=args.ids)
+    for i, vec in enumerate(rng.normal(size=(args.ids, args.dim))):
+        gallery.add(f"id{i}", vec)
+
+    def per_face(embs):
+        return [gallery.match(e) for e in embs]
+
+    def batched(embs):
+        return gallery.match_many(embs)
+
+    print(f"[INFO] Gallery: {args.ids} ids x {args.dim}-dim")
+    print("=" * 60)
+    print(f"{'faces':>6}{'per-face ms':>16}{'batched ms':>14}{'batched ms/face':>18}")
+    print("-" * 60)
+    for n in args.faces:
+        embs = rng.normal(size=(n, args.dim)).astype(np.float32)
+        loop_ms = per_frame_ms(per_face, embs, args.repeat)
+        batch_ms = per_frame_ms(batched, embs, args.repeat)
+        print(f"{n:>6}{loop_ms:>16.3f}{batch_ms:>14.3f}{batch_ms / n:>18.3f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
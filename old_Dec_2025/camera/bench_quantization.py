@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# camera/bench_quantization.py
+# fp32 vs int8 (quantize_models.py): latency, throughput, embedding agreement, verification accuracy
+#
+# --images: labelled set, one directory per person:  <dir>/<name>/*.jpg
+# (112x112 images are taken as aligned crops, others go through the fp32 detector)
+
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from gallery import l2_normalize
+from quantize_models import face_crops, list_images
+from recognition_engine import RecognitionEngine
+from tracker import iou_matrix
+
+
+def timed_ms(fn, repeat):
+    fn()  # warmup
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def embed_all(engine, crops, batch=32):
+    return l2_normalize(np.concatenate([engine.embed(crops[i:i + batch]) for i in range(0, len(crops), batch)]))
+
+
+def verification(embs, labels, threshold):
+    """All pairs: (accuracy at `threshold`, best accuracy, best threshold)."""
+    sims = embs @ embs.T
+    iu = np.triu_indices(len(embs), k=1)
+    sims = sims[iu]
+    same = (labels[:, None] == labels[None, :])[iu]
+
+    accuracy = float(((sims >= threshold) == same).mean())
+    best_acc, best_t = 0.0, threshold
+    for t in np.linspace(0.0, 1.0, 201):
+        acc = float(((sims >= t) == same).mean())
+        if acc > best_acc:
+            best_acc, best_t = acc, float(t)
+    return accuracy, best_acc, best_t
+
+
+def detection_recall(ref, test, iou=0.5):
+    """Share of reference boxes that the other model also finds (IoU >= iou)."""
+    found = total = 0
+    for a, b in zip(ref, test):
+        total += len(a)
+        if len(a) and len(b):
+            found += int((iou_matrix(a, b).max(axis=1) >= iou).sum())
+    return found / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 vs FP32 benchmark")
+    parser.add_argument("--images", required=True, help="Labelled image directory (<dir>/<name>/*.jpg)")
+    parser.add_argument("--pack", default="buffalo_l")
+    parser.add_argument("--root", default="~/.insightface")
+    parser.add_argument("--det_size", type=int, default=320)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads per session (0 = auto)")
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 8, 32], help="Recognizer batch sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=0.4, help="Cosine threshold of the pipelines")
+    args = parser.parse_args()
+
+    paths = list_images(args.images)
+    loaded = [(p, cv2.imread(p)) for p in paths]
+    loaded = [(p, img) for p, img in loaded if img is not None]
+    images = [img for _, img in loaded]
+    names = [os.path.relpath(os.path.dirname(p), args.images) for p, _ in loaded]
+    print(f"[INFO] {len(images)} images, {len(set(names))} identities")
+    if not images:
+        return
+
+    engines = {}
+    for precision in ("fp32", "int8"):
+        engines[precision] = RecognitionEngine(
+            args.pack, args.root, det_size=(args.det_size, args.det_size), precision=precision,
+            det_threads=(args.threads, 1), rec_threads=(args.threads, 1))
+        print(f"[INFO] {precision}: {engines[precision].describe()}")
+    if set(engines["int8"].precisions.values()) != {"int8"}:
+        print("[ERROR] INT8 models missing, run quantize_models.py first")
+        return
+
+    # Same aligned crops for both precisions (fp32 detector), so the recognizer is compared alone
+    crops, sources = face_crops(images, engines["fp32"])
+    labels = np.array([names[i] for i in sources])
+    print(f"[INFO] Aligned faces: {len(crops)}")
+    if len(crops) == 0:
+        return
+
+    results = {}
+    sample = images[:min(len(images), 50)]
+    for precision, engine in engines.items():
+        r = results[precision] = {}
+        r["det_ms"] = timed_ms(lambda: [engine.detect(img) for img in sample], args.repeat) / len(sample)
+        r["rec_ms"] = {}
+        for b in args.batches:
+            batch = crops[np.arange(b) % len(crops)]
+            r["rec_ms"][b] = timed_ms(lambda: engine.embed(batch), args.repeat)
+        r["boxes"] = [engine.detect(img)[0] for img in images]
+        r["embs"] = embed_all(engine, crops)
+        r["verify"] = verification(r["embs"], labels, args.threshold)
+
+    fp32, int8 = results["fp32"], results["int8"]
+    cos = (fp32["embs"] * int8["embs"]).sum(axis=1)
+
+    print("=" * 64)
+    print(f"{'':<28}{'fp32':>16}{'int8':>16}")
+    print("-" * 64)
+    print(f"{'detect ms / image':<28}{fp32['det_ms']:>16.2f}{int8['det_ms']:>16.2f}")
+    print(f"{'detect images / s':<28}{1000 / fp32['det_ms']:>16.1f}{1000 / int8['det_ms']:>16.1f}")
+    for b in args.batches:
+        print(f"{f'embed ms / batch {b}':<28}{fp32['rec_ms'][b]:>16.2f}{int8['rec_ms'][b]:>16.2f}")
+        print(f"{f'embed faces / s (batch {b})':<28}{b * 1000 / fp32['rec_ms'][b]:>16.1f}"
+              f"{b * 1000 / int8['rec_ms'][b]:>16.1f}")
+    for i, label in enumerate(("accuracy @ threshold", "best accuracy", "best threshold")):
+        print(f"{label:<28}{fp32['verify'][i]:>16.4f}{int8['verify'][i]:>16.4f}")
+    print("-" * 64)
+    print(f"embedding cosine fp32 vs int8: mean {cos.mean():.4f}, min {cos.min():.4f}, "
+          f"p1 {np.percentile(cos, 1):.4f}")
+    print(f"int8 detector recall of fp32 faces (IoU >= 0.5): "
+          f"{detection_recall(fp32['boxes'], int8['boxes']) * 100:.1f}%")
+    print("=" * 64)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,57 @@
 # camera/decoder.py
 
+import time
+from fractions import Fraction
+
 import av
 import numpy as np
 
+RTP_TIME_BASE = Fraction(1, 90000)  # H.264 RTP clock
+
+# Skip levels used when decoding falls behind real time
+SKIP_NONE = 0      # decode everything
+SKIP_NONREF = 1    # drop non-reference pictures (nothing predicts from them)
+SKIP_NONKEY = 2    # keyframes only
+
+
 class H264Decoder:
-    def __init__(self):
+    def __init__(self, threads=0, thread_type="AUTO", skip_loop_filter=None,
+                 behind_realtime=False, nonref_lag=0.25, keyframe_lag=1.0):
+        """
+        threads:          decoder threads, 0 = one per core
+        thread_type:      "SLICE", "FRAME" or "AUTO" (FRAME adds `threads` frames of latency)
+        skip_loop_filter: None, "nonref" or "all" (fixed when the codec opens)
+        behind_realtime:  measure lag from RTP timestamps vs wall clock and skip
+                          pictures once it passes nonref_lag / keyframe_lag seconds
+        """
         self.codec = av.CodecContext.create("h264", "r")
+        self.codec.thread_count = threads
+        self.codec.thread_type = thread_type
+        if skip_loop_filter:
+            self.codec.options = {"skip_loop_filter": skip_loop_filter}
+
+        self.behind_realtime = behind_realtime
+        self.nonref_lag = nonref_lag
+        self.keyframe_lag = keyframe_lag
+        self.skip_level = SKIP_NONE
+        self.lag = 0.0
+
+        self.need_keyframe = False   # a reference picture was skipped
+        self._clock_base = None      # min(wall - media) seen so far
+        self._last_ts = None
+        self._media_time = 0.0       # unwrapped RTP time in seconds
+
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+
+    @property
+    def stats(self):
+        return {
+            "decoded": self.frames_decoded,
+            "skipped": self.frames_skipped,
+            "skip_level": self.skip_level,
+            "lag": self.lag,
+        }
 
     def decode(self, nal_unit):
         """Decode a raw H.264 NAL unit into frames."""
@@ -14,4 +60,68 @@ class H264Decoder:
         for p in packets:
             f_list = self.codec.decode(p)
             frames.extend(f_list)
+        self.frames_decoded += len(frames)
+        return frames
+
+    # -------------------------------------------
+    # Behind real-time handling
+    # -------------------------------------------
+    def set_lag(self, lag):
+        """Seconds behind real time (measured here or by the caller's queue)."""
+        self.lag = lag
+        if lag >= self.keyframe_lag:
+            self.skip_level = SKIP_NONKEY
+        elif lag >= self.nonref_lag:
+            self.skip_level = SKIP_NONREF
+        else:
+            self.skip_level = SKIP_NONE
+
+    def _update_lag(self, timestamp):
+        if self._last_ts is not None:
+            delta = (timestamp - self._last_ts) & 0xFFFFFFFF
+            if delta >= 0x80000000:
+                delta -= 0x100000000
+            self._media_time += delta / 90000.0
+        self._last_ts = timestamp
+
+        offset = time.monotonic() - self._media_time
+        if self._clock_base is None or offset < self._clock_base:
+            self._clock_base = offset
+        self.set_lag(offset - self._clock_base)
+
+    def _should_skip(self, au):
+        if not au.picture:
+            return False   # parameter sets / SEI only: the next IDR cannot decode without them
+
+        if au.keyframe:
+            self.need_keyframe = False
+            return False
+
+        if self.need_keyframe:
+            return True
+
+        if self.skip_level >= SKIP_NONKEY:
+            # Later pictures reference this one: stay skipped until the next keyframe
+            self.need_keyframe = au.reference
+            return True
+
+        return self.skip_level >= SKIP_NONREF and not au.reference
+
+    def decode_access_unit(self, au):
+        """
+        Decode one complete picture (h264_rtp_parser.AccessUnit) with a single
+        decode call. Output frames carry the RTP timestamp as pts (1/90000 s).
+        """
+        if self.behind_realtime and au.timestamp is not None:
+            self._update_lag(au.timestamp)
+
+        if self._should_skip(au):
+            self.frames_skipped += 1
+            return []
+
+        packet = av.Packet(au.data)
+        packet.pts = au.timestamp
+        packet.time_base = RTP_TIME_BASE
+        frames = self.codec.decode(packet)
+        self.frames_decoded += len(frames)
         return frames
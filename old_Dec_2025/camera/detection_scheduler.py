@@ -0,0 +1,186 @@
+# camera/detection_scheduler.py
+#
+# Adaptive detection interval (replaces a fixed --stride).
+#
+#   empty scene for idle_after s  -> idle_interval   (near idle)
+#   faces moving                  -> min_interval    (every frame)
+#   faces standing still          -> base interval   (--stride)
+#
+# On top of that the interval never drops below what the detector can keep
+# up with (measured latency vs frame period), and doubles whenever
+# queue lag + detector latency exceeds the latency budget.
+
+import math
+import time
+
+import numpy as np
+
+
+class AdaptiveScheduler:
+    def __init__(self, interval=2, budget=0.2, min_interval=1, max_interval=15,
+                 idle_interval=None, idle_after=3.0, move_threshold=0.5,
+                 utilization=0.7, alpha=0.2):
+        """
+        interval:       starting / static-scene interval in frames (old --stride)
+        budget:         seconds allowed for queue lag + detector latency
+        move_threshold: face motion (box widths per second) that counts as moving
+        utilization:    share of frame time the detector may use on average
+        alpha:          EMA weight for latency, lag and frame time
+        """
+        self.base_interval = max(min_interval, interval)
+        self.interval = self.base_interval
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval or max_interval
+        self.idle_after = idle_after
+        self.move_threshold = move_threshold
+        self.utilization = utilization
+        self.alpha = alpha
+
+        self.frames_since = self.interval   # detect on the first frame
+        self.latency = 0.0                  # detector seconds (EMA)
+        self.lag = 0.0                      # queue lag seconds (EMA)
+        self.frame_time = None              # seconds between frames (EMA)
+        self.motion = 0.0
+        self.state = "static"               # "idle" | "static" | "moving"
+
+        self._last_frame = None
+        self._last_face = time.monotonic()
+        self._prev_centers = None
+        self._prev_time = None
+
+        self.frames = 0
+        self.detections = 0
+        self.skipped = 0
+
+    def _ema(self, old, new):
+        return new if old is None else old + self.alpha * (new - old)
+
+    def should_detect(self, lag=0.0):
+        """
+        Call once per frame. lag: seconds the frame waited before reaching the
+        detector (capture timestamp -> now, or the decoder's lag).
+        """
+        now = time.monotonic()
+        if self._last_frame is not None:
+            self.frame_time = self._ema(self.frame_time, now - self._last_frame)
+        self._last_frame = now
+        self.lag = self._ema(self.lag, lag)
+
+        self.frames += 1
+        self.frames_since += 1
+        if self.frames_since >= self.interval:
+            self.frames_since = 0
+            return True
+        return False
+
+    def record(self, latency, boxes=None, motion=None):
+        """
+        Call after each detection.
+        boxes:  detected (n, 4) x1, y1, x2, y2 (motion is estimated from them)
+        motion: box widths per second from a tracker, overrides the estimate
+        """
+        now = time.monotonic()
+        self.detections += 1
+        self.latency = latency if self.detections == 1 else self._ema(self.latency, latency)
+
+        appeared = False
+        if boxes is not None:
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+            if len(boxes):
+                appeared = self._prev_centers is None   # faces entering an empty scene
+                self._last_face = now
+                estimate = self._box_motion(boxes, now)
+                if motion is None:
+                    motion = estimate
+            else:
+                self._prev_centers = None
+        self.motion = motion or 0.0
+
+        if boxes is not None and len(boxes) == 0 and now - self._last_face >= self.idle_after:
+            self.state = "idle"
+        elif appeared or self.motion >= self.move_threshold:
+            # Appearing faces jump straight to min_interval instead of stepping down from idle
+            self.state = "moving"
+        else:
+            self.state = "static"
+
+        self._adjust()
+
+    def skip(self, faces=0):
+        """
+        Call instead of record() when a scheduled detection was skipped
+        because nothing changed (motion gate): faces stay, none moved.
+        faces: number of faces still tracked
+        """
+        now = time.monotonic()
+        self.skipped += 1
+        self.motion = 0.0
+
+        if faces:
+            self._last_face = now
+            self.state = "static"
+        else:
+            self._prev_centers = None
+            self.state = "idle" if now - self._last_face >= self.idle_after else "static"
+
+        self._adjust()
+
+    def _box_motion(self, boxes, now):
+        """Largest center shift since the last detection, in box widths per second."""
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        widths = np.maximum(boxes[:, 2] - boxes[:, 0], 1.0)
+
+        motion = 0.0
+        if self._prev_centers is not None:
+            # Nearest previous face per face (faces entering an empty scene: see record())
+            d = np.linalg.norm(centers[:, None] - self._prev_centers[None], axis=2).min(axis=1)
+            motion = float((d / widths).max()) / max(now - self._prev_time, 1e-3)
+
+        self._prev_centers = centers
+        self._prev_time = now
+        return motion
+
+    def _adjust(self):
+        target = {
+            "idle": self.idle_interval,
+            "moving": self.min_interval,
+            "static": self.base_interval,
+        }[self.state]
+
+        # Never schedule more detector work than the frame rate leaves room for
+        if self.frame_time:
+            target = max(target, math.ceil(self.latency / (self.frame_time * self.utilization)))
+
+        # Over budget: back off fast
+        if self.lag + self.latency > self.budget:
+            target = max(target, self.interval * 2)
+
+        target = min(max(target, self.min_interval), self.max_interval)
+
+        # Speed up one step at a time (no oscillation), except for moving faces
+        if target < self.interval and self.state != "moving":
+            self.interval -= 1
+        else:
+            self.interval = target
+
+    @property
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "state": self.state,
+            "latency_ms": self.latency * 1000.0,
+            "lag_ms": self.lag * 1000.0,
+            "fps": 1.0 / self.frame_time if self.frame_time else 0.0,
+            "motion": self.motion,
+            "frames": self.frames,
+            "detections": self.detections,
+            "skipped": self.skipped,
+        }
+
+    def format_stats(self):
+        s = self.stats
+        return (f"interval={s['interval']} ({s['state']}) detector={s['latency_ms']:.1f}ms "
+                f"lag={s['lag_ms']:.1f}ms fps={s['fps']:.1f} detections={s['detections']}/{s['frames']} "
+                f"skipped={s['skipped']}")
@@ -2,20 +2,86 @@
 
 import threading
 
+import numpy as np
+
+
 class FrameBuffer:
+    """
+    Fixed-capacity ring of preallocated frame slots (latest frame wins).
+
+    Slots are allocated on the first frame (and again if the resolution
+    changes); add() copies into the next slot in O(1). Consumers get
+    read-only views of a slot without copying. A slot is reused after
+    `size` more frames, so a consumer that needs a frame for longer must
+    copy it.
+    """
+
     def __init__(self, size=10):
         self.size = size
-        self.buffer = []
+        self.slots = None
+        self.seqs = np.full(size, -1, dtype=np.int64)   # sequence stored in each slot
+        self.seq = -1                                    # newest sequence number
         self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+
+        self.overwritten = 0   # slots reused before any consumer read them
+        self.dropped = 0       # frames consumers skipped over (latest-wins)
+        self._read = np.zeros(size, dtype=bool)
+
+    def _allocate(self, frame):
+        self.slots = np.empty((self.size,) + frame.shape, dtype=frame.dtype)
+        self.seqs[:] = -1
+        self._read[:] = False
 
     def add(self, frame):
-        with self.lock:
-            if len(self.buffer) >= self.size:
-                self.buffer.pop(0)
-            self.buffer.append(frame)
+        """Copy a frame into the next slot and wake every waiting consumer."""
+        with self.cond:
+            if self.slots is None or self.slots.shape[1:] != frame.shape or self.slots.dtype != frame.dtype:
+                self._allocate(frame)
+
+            seq = self.seq + 1
+            idx = seq % self.size
+            if self.seqs[idx] >= 0 and not self._read[idx]:
+                self.overwritten += 1
+
+            np.copyto(self.slots[idx], frame)
+            self.seqs[idx] = seq
+            self._read[idx] = False
+            self.seq = seq
+            self.cond.notify_all()
+            return seq
+
+    def _view(self, seq):
+        idx = seq % self.size
+        self._read[idx] = True
+        view = self.slots[idx].view()
+        view.flags.writeable = False
+        return view
 
     def get_latest(self):
         with self.lock:
-            if not self.buffer:
+            if self.seq < 0:
+                return None
+            return self._view(self.seq)
+
+    def wait_newer(self, seq, timeout=None):
+        """
+        Block until a frame newer than `seq` exists (use -1 for the first frame).
+        return: (seq, read-only view) of the latest frame, or None on timeout
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > seq, timeout):
                 return None
-            return self.buffer[-1]
+
+            if seq >= 0:
+                self.dropped += self.seq - seq - 1
+            return self.seq, self._view(self.seq)
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {
+                "latest": self.seq,
+                "overwritten": self.overwritten,
+                "dropped": self.dropped,
+            }
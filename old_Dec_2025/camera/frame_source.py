@@ -0,0 +1,278 @@
+# camera/frame_source.py
+#
+# Offline frame sources (no camera needed):
+#
+#   PcapSource       recorded RTP/UDP capture -> H264RTPParser -> H264Decoder
+#   AnnexBSource     raw .h264 elementary stream -> H264Decoder
+#   VideoFileSource  .mp4 / .mkv / .avi ... via cv2.VideoCapture
+#
+# paced=True releases frames at their recorded times (real time),
+# paced=False as fast as downstream takes them (throughput / regression runs).
+# Every source iterates as (media_time_seconds, BGR ndarray).
+
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+
+# pcap global header magic -> (byte order, timestamp unit)
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+
+LINK_NULL = 0
+LINK_ETHERNET = 1
+LINK_RAW = 101
+LINK_LINUX_SLL = 113
+LINK_LINUX_SLL2 = 276
+
+H264_NAL_TYPES = set(range(1, 24)) | {24, 28}   # single NAL, STAP-A, FU-A
+
+
+def read_pcap(path):
+    """Yield (capture_time, link_type, frame bytes) from a classic libpcap file."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if header[:4] == PCAPNG_MAGIC:
+            raise ValueError(f"{path}: pcapng is not supported, convert with: "
+                             f"editcap -F pcap in.pcapng out.pcap")
+        if len(header) < 24 or header[:4] not in PCAP_MAGIC:
+            raise ValueError(f"{path}: not a pcap file")
+
+        order, unit = PCAP_MAGIC[header[:4]]
+        link_type = struct.unpack(order + "I", header[20:24])[0] & 0x0FFFFFFF
+        record = struct.Struct(order + "IIII")
+
+        while True:
+            rec = f.read(16)
+            if len(rec) < 16:
+                return
+            sec, frac, incl_len, _ = record.unpack(rec)
+            data = f.read(incl_len)
+            if len(data) < incl_len:
+                return
+            yield sec + frac * unit, link_type, data
+
+
+def udp_payload(link_type, frame):
+    """Link-layer frame -> (dst_port, UDP payload), None for anything else."""
+    if link_type == LINK_ETHERNET:
+        offset, ethertype = 14, frame[12:14]
+        while ethertype in (b"\x81\x00", b"\x88\xa8") and len(frame) >= offset + 4:   # VLAN tags
+            ethertype = frame[offset + 2:offset + 4]
+            offset += 4
+    elif link_type == LINK_LINUX_SLL:
+        offset, ethertype = 16, frame[14:16]
+    elif link_type == LINK_LINUX_SLL2:
+        offset, ethertype = 20, frame[0:2]
+    elif link_type == LINK_NULL:
+        offset, ethertype = 4, None
+    elif link_type == LINK_RAW:
+        offset, ethertype = 0, None
+    else:
+        return None
+
+    ip = frame[offset:]
+    if not ip:
+        return None
+    version = ip[0] >> 4
+    if ethertype not in (None, b"\x08\x00", b"\x86\xdd"):
+        return None
+
+    if version == 4:
+        ihl = (ip[0] & 0x0F) * 4
+        if ip[9] != 17 or (struct.unpack("!H", ip[6:8])[0] & 0x1FFF):   # not UDP / not first fragment
+            return None
+        udp = ip[ihl:]
+    elif version == 6:
+        if ip[6] != 17:
+            return None
+        udp = ip[40:]
+    else:
+        return None
+
+    if len(udp) < 8:
+        return None
+    dst_port, length = struct.unpack("!HH", udp[2:6])
+    return dst_port, udp[8:length] if length >= 8 else udp[8:]
+
+
+class FrameSource(ABC):
+    """Base: pacing, looping and counters around _frames() -> (media_time, img)."""
+
+    def __init__(self, path, paced=True, loop=False, speed=1.0):
+        """
+        paced: release frames at recorded times (x speed), else as fast as possible
+        loop:  start over at the end (endless load tests)
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.paced = paced
+        self.loop = loop
+        self.speed = speed
+
+        self.frames = 0
+        self.started = None
+        self.finished = None
+        self.late = 0.0      # paced: seconds behind schedule (downstream too slow)
+
+    @abstractmethod
+    def _frames(self):
+        """Yield (media_time_seconds, BGR img) once through the input."""
+
+    def __iter__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        try:
+            while True:
+                base = None   # pacing restarts with every pass
+                for media_time, img in self._frames():
+                    if self.paced:
+                        now = time.monotonic()
+                        if base is None:
+                            base = now - media_time / self.speed
+                        delay = base + media_time / self.speed - now
+                        if delay > 0:
+                            time.sleep(delay)
+                        elif delay < 0:
+                            self.late = -delay
+                    self.frames += 1
+                    yield media_time, img
+                if not self.loop or self.frames == 0:
+                    return
+        finally:
+            self.finished = time.monotonic()
+
+    @property
+    def stats(self):
+        elapsed = (self.finished or time.monotonic()) - self.started if self.started else 0.0
+        return {
+            "frames": self.frames,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "paced": self.paced,
+            "late": self.late,
+        }
+
+
+class PcapSource(FrameSource):
+    def __init__(self, path, paced=True, loop=False, speed=1.0, port=None, payload_type=None,
+                 decoder_threads=0):
+        """
+        port:         UDP destination port of the video RTP stream (default: any)
+        payload_type: RTP payload type of H.264 (default: first dynamic PT carrying H.264 NALs)
+        Frames are timed by the capture time of the packet that completed them.
+        """
+        super().__init__(path, paced, loop, speed)
+        self.port = port
+        self.payload_type = payload_type
+        self.decoder_threads = decoder_threads
+        self.parser = None
+        self.decoder = None
+
+    def _is_video(self, payload):
+        if len(payload) < 13 or payload[0] >> 6 != 2:
+            return False
+        pt = payload[1] & 0x7F
+        if self.payload_type is not None:
+            return pt == self.payload_type
+        return pt >= 96 and (payload[12 + 4 * (payload[0] & 0x0F)] & 0x1F) in H264_NAL_TYPES
+
+    def _frames(self):
+        from decoder import H264Decoder
+        from h264_rtp_parser import H264RTPParser
+
+        self.parser = H264RTPParser()
+        self.decoder = H264Decoder(threads=self.decoder_threads)
+        ssrc = None
+
+        for stamp, link_type, frame in read_pcap(self.path):
+            udp = udp_payload(link_type, frame)
+            if udp is None:
+                continue
+            port, payload = udp
+            if self.port is not None and port != self.port:
+                continue
+            if ssrc is None:
+                if not self._is_video(payload):
+                    continue
+                ssrc = payload[8:12]   # lock on the first H.264 stream
+            elif payload[8:12] != ssrc or len(payload) < 13:
+                continue
+
+            for au in self.parser.feed(payload, now=stamp):
+                for f in self.decoder.decode_access_unit(au):
+                    yield stamp, f.to_ndarray(format="bgr24")
+
+        if ssrc is None:
+            print(f"[WARNING] No H.264 RTP stream found in {self.path}")
+            return
+
+        # End of file: held packets, a last picture without marker bit, delayed pictures
+        frames = [f for au in self.parser.flush() for f in self.decoder.decode_access_unit(au)]
+        frames += self.decoder.codec.decode(None)
+        for f in frames:
+            yield stamp, f.to_ndarray(format="bgr24")
+
+
+class AnnexBSource(FrameSource):
+    def __init__(self, path, paced=True, loop=False, speed=1.0, fps=25.0, chunk_size=64 * 1024,
+                 decoder_threads=0):
+        """fps: frame rate for pacing / timestamps (raw H.264 carries no timing)."""
+        super().__init__(path, paced, loop, speed)
+        self.fps = fps
+        self.chunk_size = chunk_size
+        self.decoder_threads = decoder_threads
+        self.decoder = None
+
+    def _frames(self):
+        from decoder import H264Decoder
+
+        self.decoder = H264Decoder(threads=self.decoder_threads)
+        index = 0
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                # Empty read flushes the parser's last buffered NAL
+                frames = self.decoder.decode(chunk or None)
+                if not chunk:
+                    frames += self.decoder.codec.decode(None)   # drain delayed pictures
+                for frame in frames:
+                    yield index / self.fps, frame.to_ndarray(format="bgr24")
+                    index += 1
+                if not chunk:
+                    return
+
+
+class VideoFileSource(FrameSource):
+    def _frames(self):
+        import cv2
+
+        cap = cv2.VideoCapture(self.path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open video file: {self.path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        index = 0
+        try:
+            while True:
+                ret, img = cap.read()
+                if not ret:
+                    return
+                yield index / fps, img
+                index += 1
+        finally:
+            cap.release()
+
+
+def open_source(path, paced=True, loop=False, **kwargs):
+    """Pick the source by file extension (.pcap, .h264 / .264, anything else = video file)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".pcap", ".cap", ".pcapng"):
+        return PcapSource(path, paced, loop, **kwargs)
+    if ext in (".h264", ".264", ".avc"):
+        return AnnexBSource(path, paced, loop, **kwargs)
+    return VideoFileSource(path, paced, loop, **kwargs)
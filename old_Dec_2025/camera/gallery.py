@@ -0,0 +1,138 @@
+# camera/gallery.py
+
+import numpy as np
+
+
+def l2_normalize(x, eps=1e-10):
+    """Row-wise L2 normalization (1-D or 2-D input), returned as float32."""
+    x = np.asarray(x, dtype=np.float32)
+    norm = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norm, eps)
+
+
+class MatchMixin:
+    """match() / match_many() on top of search(query, k) -> (names, scores), best first."""
+
+    def check_dim(self, dim):
+        """Raise if embeddings of size `dim` cannot be matched against this gallery."""
+        if dim != self.dim:
+            source = getattr(self, "path", type(self).__name__)
+            raise ValueError(f"Gallery {source} holds {self.dim}-dim embeddings, got {dim}-dim "
+                             f"(built with a different recognition model?)")
+
+    def match(self, emb, threshold=0.65):
+        """Best matching name for one embedding, or "Unknown"."""
+        if len(self) == 0:
+            return "Unknown"
+        names, scores = self.search(emb, k=1)
+        if len(names) == 0 or scores[0] < threshold:
+            return "Unknown"
+        return names[0]
+
+    def match_many(self, embs, threshold=0.65):
+        """Best matching name per row of (n, d) embeddings, one batched search."""
+        if len(embs) == 0:
+            return []
+        if len(self) == 0:
+            return ["Unknown"] * len(embs)
+        names, scores = self.search(np.atleast_2d(embs), k=1)
+        return [n[0] if len(n) and s[0] >= threshold else "Unknown"
+                for n, s in zip(names, scores)]
+
+
+class EmbeddingGallery(MatchMixin):
+    """
+    Enrolled face embeddings kept in one contiguous float32 matrix.
+
+    Every row is L2-normalized once at enrollment, so a search is a single
+    matrix product (cosine similarity == dot product). Rows [0, size) are
+    live; add/remove work in place and never rebuild the whole gallery.
+    """
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self.size = 0
+        self.vecs = np.zeros((capacity, dim), dtype=np.float32)
+        self.names = np.empty(capacity, dtype=object)
+        self.index = {}  # name -> row
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, name):
+        return name in self.index
+
+    # -------------------------------------------
+    # Enrollment
+    # -------------------------------------------
+    def _grow(self):
+        capacity = max(1, 2 * len(self.vecs))
+        vecs = np.zeros((capacity, self.dim), dtype=np.float32)
+        vecs[:self.size] = self.vecs[:self.size]
+        names = np.empty(capacity, dtype=object)
+        names[:self.size] = self.names[:self.size]
+        self.vecs = vecs
+        self.names = names
+
+    def add(self, name, emb):
+        """Enroll (or replace) one identity."""
+        row = self.index.get(name)
+        if row is None:
+            if self.size == len(self.vecs):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.names[row] = name
+            self.index[name] = row
+
+        self.vecs[row] = l2_normalize(emb)
+
+    def remove(self, name):
+        """Remove one identity by moving the last row into its slot."""
+        row = self.index.pop(name, None)
+        if row is None:
+            return False
+
+        last = self.size - 1
+        if row != last:
+            self.vecs[row] = self.vecs[last]
+            self.names[row] = self.names[last]
+            self.index[self.names[row]] = row
+
+        self.names[last] = None
+        self.size = last
+        return True
+
+    # -------------------------------------------
+    # Search
+    # -------------------------------------------
+    def search(self, query, k=1):
+        """
+        query: (d,) or (n, d) embeddings
+        return: (names, scores) of the top-k rows, best first,
+                shaped (k,) for a single query or (n, k) for a batch
+        """
+        q = l2_normalize(query)
+        single = q.ndim == 1
+        q = np.atleast_2d(q)
+
+        k = min(k, self.size)
+        if k == 0:
+            empty = np.empty((len(q), 0))
+            return (empty[0], empty[0]) if single else (empty, empty)
+
+        sims = q @ self.vecs[:self.size].T
+
+        if k == 1:
+            top = np.argmax(sims, axis=1)[:, None]
+        else:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+
+        scores = np.take_along_axis(sims, top, axis=1)
+        names = self.names[top]
+
+        if single:
+            return names[0], scores[0]
+        return names, scores
@@ -0,0 +1,294 @@
+# camera/gallery_store.py
+#
+# Versioned binary gallery file opened with numpy.memmap.
+#
+# Layout (little endian):
+#   [0, 64)          header  (magic, version, dtype, dim, count, capacity, names_size)
+#   [64, ...)        vector block   capacity x dim  float32 | float16 (L2-normalized rows)
+#   [...]            offsets table  (capacity + 1) uint64, byte offsets into the name blob
+#   [...]            name blob      UTF-8 names, grows at the end of the file
+#
+# Opening only maps the file, so startup cost does not depend on gallery size and
+# every process that opens the same file shares one page-cache copy. Appends write
+# rows into the preallocated vector block and names at the end of the file; the
+# header `count` is written last so readers never see a half-written row.
+# Writers serialize on an flock of `<path>.lock` (the data file itself is
+# replaced when it grows, so a lock on it would not survive a resize).
+
+import fcntl
+import os
+from contextlib import contextmanager
+import struct
+import numpy as np
+
+from gallery import EmbeddingGallery, MatchMixin, l2_normalize
+
+MAGIC = b"FGAL"
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_FMT = "<4sHBxIQQQ"   # magic, version, dtype code, dim, count, capacity, names_size
+
+DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")}
+DTYPE_CODES = {np.dtype("<f4"): 0, np.dtype("<f2"): 1}
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"Not a gallery file (truncated header): {path}")
+
+    magic, version, code, dim, count, capacity, names_size = struct.unpack_from(HEADER_FMT, raw)
+    if magic != MAGIC:
+        raise ValueError(f"Not a gallery file (bad magic): {path}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported gallery file version {version}: {path}")
+    if code not in DTYPES:
+        raise ValueError(f"Unknown vector dtype code {code}: {path}")
+
+    return {
+        "dtype": DTYPES[code], "dim": dim, "count": count,
+        "capacity": capacity, "names_size": names_size,
+    }
+
+
+def _pack_header(dtype, dim, count, capacity, names_size):
+    header = struct.pack(HEADER_FMT, MAGIC, VERSION, DTYPE_CODES[dtype],
+                         dim, count, capacity, names_size)
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def _block_offsets(dtype, dim, capacity):
+    """Byte offsets of the vector block, offsets table and name blob."""
+    vec_start = HEADER_SIZE
+    offsets_start = vec_start + capacity * dim * dtype.itemsize
+    names_start = offsets_start + (capacity + 1) * 8
+    return vec_start, offsets_start, names_start
+
+
+class GalleryFile(MatchMixin):
+    """
+    Memory-mapped, append-only gallery file.
+
+    Search/match use the same API as EmbeddingGallery and run directly on the
+    mapped vector block. Call refresh() to pick up rows appended by another
+    process. add() appends (there is no in-place replace or remove: use
+    load_gallery() / save_gallery() to edit).
+    """
+
+    def __init__(self, path, dim=None):
+        """dim: expected embedding size (recognition model output), checked against the file"""
+        self.path = path
+        self.capacity = None
+        self.names_size = None
+        self._inode = None
+        self.refresh(force=True)
+        if dim is not None:
+            self.check_dim(dim)
+
+    # -------------------------------------------
+    # Create / open
+    # -------------------------------------------
+    @classmethod
+    def create(cls, path, dim, dtype="float32", capacity=1024):
+        dtype = np.dtype(dtype).newbyteorder("<")
+        if dtype not in DTYPE_CODES:
+            raise ValueError("Gallery vectors must be float32 or float16")
+
+        names_start = _block_offsets(dtype, dim, capacity)[2]
+        with open(path, "wb") as f:
+            f.write(_pack_header(dtype, dim, 0, capacity, 0))
+            f.truncate(names_start)
+
+        return cls(path)
+
+    def refresh(self, force=False):
+        """Re-read the header; remap if the file grew or was rewritten."""
+        header = _read_header(self.path)
+        stat = os.stat(self.path)
+
+        remap = (
+            force
+            or header["capacity"] != self.capacity
+            or header["names_size"] != self.names_size
+            or stat.st_ino != self._inode
+        )
+
+        self.dtype = header["dtype"]
+        self.dim = header["dim"]
+        self.capacity = header["capacity"]
+        self.names_size = header["names_size"]
+        self.size = header["count"]
+        self._inode = stat.st_ino
+
+        if remap:
+            self._raw = np.memmap(self.path, dtype=np.uint8, mode="r")
+            vec_start, offsets_start, names_start = _block_offsets(self.dtype, self.dim, self.capacity)
+            self._vecs = self._raw[vec_start:offsets_start].view(self.dtype).reshape(self.capacity, self.dim)
+            self._offsets = self._raw[offsets_start:names_start].view("<u8")
+            self._names = self._raw[names_start:]
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def vecs(self):
+        """(size, dim) read-only view of the mapped vector block."""
+        return self._vecs[:self.size]
+
+    def name(self, row):
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return self._names[start:end].tobytes().decode("utf-8")
+
+    def names(self):
+        return [self.name(i) for i in range(self.size)]
+
+    # -------------------------------------------
+    # Append
+    # -------------------------------------------
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive lock shared by every process appending to this gallery."""
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, names, vecs):
+        """Append identities without rewriting existing rows (safe across processes)."""
+        names = list(names)
+        vecs = l2_normalize(np.atleast_2d(vecs)).astype(self.dtype)
+        self.check_dim(vecs.shape[1])
+        if len(names) != len(vecs):
+            raise ValueError("names and vecs must have the same length")
+
+        with self._write_lock():
+            # Another writer may have appended or grown the file since our last look
+            self.refresh()
+            if self.size + len(names) > self.capacity:
+                self._grow(self.size + len(names))
+            self._write_rows(names, vecs)
+
+    def _write_rows(self, names, vecs):
+        """Write rows after the current ones, then publish them (caller holds the lock)."""
+        encoded = [n.encode("utf-8") for n in names]
+        sizes = np.array([len(e) for e in encoded], dtype="<u8")
+        new_offsets = self.names_size + np.cumsum(sizes)
+
+        vec_start, offsets_start, names_start = _block_offsets(self.dtype, self.dim, self.capacity)
+        row_bytes = self.dim * self.dtype.itemsize
+
+        with open(self.path, "r+b") as f:
+            f.seek(vec_start + self.size * row_bytes)
+            f.write(vecs.tobytes())
+
+            f.seek(offsets_start + (self.size + 1) * 8)
+            f.write(new_offsets.tobytes())
+
+            f.seek(names_start + self.names_size)
+            f.write(b"".join(encoded))
+            f.flush()
+
+            # Commit: publish the new count/names_size only after the data is written
+            f.seek(0)
+            f.write(_pack_header(self.dtype, self.dim, self.size + len(names),
+                                 self.capacity, int(new_offsets[-1]) if len(names) else self.names_size))
+
+        self.refresh()
+
+    def add(self, name, emb):
+        """Append one identity (a repeated name adds another template row)."""
+        self.append([name], np.atleast_2d(emb))
+
+    def _grow(self, min_capacity):
+        """Rewrite into a file with doubled capacity (amortized, rare; caller holds the lock)."""
+        capacity = max(min_capacity, 2 * self.capacity)
+        tmp = self.path + ".tmp"
+
+        vec_start, offsets_start, names_start = _block_offsets(self.dtype, self.dim, capacity)
+        with open(tmp, "wb") as f:
+            f.write(_pack_header(self.dtype, self.dim, self.size, capacity, self.names_size))
+            f.write(self.vecs.tobytes())
+            f.seek(offsets_start)
+            f.write(self._offsets[:self.size + 1].tobytes())
+            f.seek(names_start)
+            f.write(self._names[:self.names_size].tobytes())
+
+        os.replace(tmp, self.path)
+        self.refresh(force=True)
+
+    # -------------------------------------------
+    # Search (same API as EmbeddingGallery)
+    # -------------------------------------------
+    def search(self, query, k=1, chunk=65536):
+        """
+        query: (d,) or (n, d) embeddings
+        return: (names, scores) of the top-k rows, best first
+        """
+        q = l2_normalize(query)
+        single = q.ndim == 1
+        q = np.atleast_2d(q)
+        self.check_dim(q.shape[1])
+
+        k = min(k, self.size)
+        if k == 0:
+            empty = np.empty((len(q), 0))
+            return (empty[0], empty[0]) if single else (empty, empty)
+
+        # Chunked so float16 blocks are upcast a slice at a time
+        sims = np.empty((len(q), self.size), dtype=np.float32)
+        for start in range(0, self.size, chunk):
+            block = self._vecs[start:min(start + chunk, self.size)]
+            sims[:, start:start + len(block)] = q @ block.T.astype(np.float32, copy=False)
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        scores = np.take_along_axis(sims, top, axis=1)
+        names = np.array([[self.name(i) for i in row] for row in top], dtype=object)
+
+        if single:
+            return names[0], scores[0]
+        return names, scores
+
+
+# -------------------------------------------
+# EmbeddingGallery <-> file
+# -------------------------------------------
+def save_gallery(gallery, path, dtype="float32"):
+    """Write an in-memory EmbeddingGallery to a new gallery file."""
+    store = GalleryFile.create(path, gallery.dim, dtype=dtype, capacity=max(1, len(gallery)))
+    if len(gallery):
+        store.append(gallery.names[:gallery.size], gallery.vecs[:gallery.size])
+    return store
+
+
+def open_gallery(path, ivf_min_size=0, nprobe=8):
+    """
+    Gallery for matching. Files with at least `ivf_min_size` identities
+    (0 = never) are loaded into an IVFIndex (approximate, nprobe buckets per
+    query); smaller ones are searched exactly on the memory map.
+    Both have the same search / match / match_many / check_dim API.
+    """
+    store = GalleryFile(path)
+    if not ivf_min_size or len(store) < ivf_min_size:
+        return store
+
+    from ann_index import IVFIndex
+    nlist = min(1024, max(1, int(4 * np.sqrt(len(store)))))
+    ivf = IVFIndex.from_gallery(store, nlist=nlist, nprobe=nprobe)
+    ivf.path = path
+    print(f"[INFO] Gallery {path}: {len(store)} identities -> IVF index (nlist={ivf.nlist}, nprobe={nprobe})")
+    return ivf
+
+
+def load_gallery(path):
+    """Copy a gallery file into an in-memory EmbeddingGallery (supports remove)."""
+    store = GalleryFile(path)
+    gallery = EmbeddingGallery(store.dim, capacity=max(1, len(store)))
+    for i, name in enumerate(store.names()):
+        gallery.add(name, store.vecs[i])
+    return gallery
@@ -1,21 +1,247 @@
 # camera/h264_rtp_parser.py
 
-# H.264 RTP payload parser with FU-A reassembly
+import time
+from collections import namedtuple
+
+START_CODE = b"\x00\x00\x00\x01"
+
+NAL_IDR = 5
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_STAP_A = 24
+NAL_FU_A = 28
+
+# One complete picture: Annex-B NALs (incl. SPS/PPS/SEI) + 90 kHz RTP timestamp.
+# reference = some slice has nal_ref_idc != 0 (other pictures predict from it)
+# picture   = holds slice (VCL) NALs; False for SPS/PPS/SEI sent with their own timestamp
+AccessUnit = namedtuple("AccessUnit", ["data", "timestamp", "keyframe", "reference", "picture"],
+                        defaults=(True,))
+
+
+def seq_delta(a, b):
+    """Signed distance a - b between two 16-bit RTP sequence numbers."""
+    d = (a - b) & 0xFFFF
+    return d - 0x10000 if d >= 0x8000 else d
+
+
+# H.264 RTP payload parser: FU-A/STAP-A, reorder buffer, access-unit assembly
 class H264RTPParser:
-    def __init__(self):
+    def __init__(self, reorder_depth=32, max_delay=0.2, max_misorder=1000):
         self.buffer = bytearray()  # For rebuilding fragmented NAL
         self.started = False       # Whether we are in a FU-A sequence
 
-    def feed(self, packet):
+        # Access unit being assembled (NALs sharing one RTP timestamp)
+        self.au = bytearray()
+        self.au_timestamp = None
+        self.au_keyframe = False
+        self.au_reference = False
+        self.au_vcl = False
+        self.au_broken = False
+        self.loss_pending = False  # loss not yet attributed to a picture (next packet decides)
+        self.fu_counted = False    # FU-A NAL in flight already counted in nals_discarded
+
+        # Jitter / reorder buffer keyed on the 16-bit RTP sequence number
+        self.reorder_depth = reorder_depth   # packets held while waiting for a gap
+        self.max_delay = max_delay           # seconds a packet is held while waiting for a gap
+        self.max_misorder = max_misorder     # larger jumps = sender restart, resync
+        self.expected_seq = None
+        self.pending = {}                    # seq -> (packet bytes, arrival time), out of order
+
+        # After a loss, drop every picture up to the next IDR
+        self.waiting_for_idr = False
+
+        # Counters
+        self.packets_received = 0
+        self.packets_lost = 0
+        self.packets_reordered = 0
+        self.packets_late = 0     # duplicates / arrived after the gap was given up
+        self.nals_discarded = 0   # partially received FU-A NALs thrown away
+        self.frames_emitted = 0
+        self.frames_dropped = 0   # broken pictures / pictures before the next IDR
+
+    @property
+    def stats(self):
+        return {
+            "received": self.packets_received,
+            "lost": self.packets_lost,
+            "reordered": self.packets_reordered,
+            "late": self.packets_late,
+            "nals_discarded": self.nals_discarded,
+            "frames_emitted": self.frames_emitted,
+            "frames_dropped": self.frames_dropped,
+        }
+
+    def feed(self, packet, now=None):
         """
-        Feed raw RTP packet bytes and return a complete NAL unit (or None)
+        Feed raw RTP packet bytes (bytes or memoryview) and return the list
+        of complete AccessUnits released by it (usually empty or one).
+        now: arrival time in seconds (default time.monotonic(), pcap replay
+             passes the capture time)
         """
+        out = []
         if len(packet) < 13:
-            return None
+            return out
+
+        now = time.monotonic() if now is None else now
+        self.packets_received += 1
+        seq = (packet[2] << 8) | packet[3]
+
+        if self.expected_seq is None:
+            self.expected_seq = seq
+
+        delta = seq_delta(seq, self.expected_seq)
+
+        if abs(delta) > self.max_misorder:
+            # Sender restarted / huge gap: resync on this packet
+            self._on_loss()
+            self.pending.clear()
+            self.expected_seq = seq
+            delta = 0
 
-        # RTP HEADER (12 bytes)
-        rtp_header = packet[:12]
-        payload = packet[12:]
+        if delta < 0 or seq in self.pending:
+            self.packets_late += 1
+        elif delta > 0:
+            # Ahead of a gap: hold a copy (the caller may reuse its buffer)
+            self.pending[seq] = (bytes(packet), now)
+        else:
+            self._process(packet, out)
+            self.expected_seq = (seq + 1) & 0xFFFF
+            self._release(out, reordered=True)
+
+        # Gap did not fill in time (too many packets or too long held): count it lost
+        while self.pending and (len(self.pending) > self.reorder_depth or
+                                now - min(t for _, t in self.pending.values()) > self.max_delay):
+            self._skip_gap()
+            self._release(out)
+
+        return out
+
+    def flush(self):
+        """
+        End of stream: give up on open gaps, release every held packet and
+        the last picture (also without its marker bit). return: AccessUnits
+        """
+        out = []
+        while self.pending:
+            self._skip_gap()
+            self._release(out)
+        if self.started:
+            self.nals_discarded += 1
+            self.au_broken = True
+            self.started = False
+        self._finish_au(out)
+        return out
+
+    # -------------------------------------------
+    # Reorder buffer
+    # -------------------------------------------
+    def _skip_gap(self):
+        # Skip to the oldest held packet
+        nxt = min(self.pending, key=lambda s: seq_delta(s, self.expected_seq))
+        self.packets_lost += seq_delta(nxt, self.expected_seq)
+        self._on_loss()
+        self.expected_seq = nxt
+
+    def _release(self, out, reordered=False):
+        # Every consecutive packet that was waiting in the buffer
+        while self.expected_seq in self.pending:
+            if reordered:
+                self.packets_reordered += 1
+            self._process(self.pending.pop(self.expected_seq)[0], out)
+            self.expected_seq = (self.expected_seq + 1) & 0xFFFF
+
+    # -------------------------------------------
+    # Loss handling
+    # -------------------------------------------
+    def _on_loss(self):
+        # The lost packets may be the tail of the open picture or the head of
+        # the next one (even right after a marker): _process() decides
+        self.loss_pending = True
+        if self.started:
+            self.nals_discarded += 1
+            self.fu_counted = True
+        self.started = False
+        self.waiting_for_idr = True
+
+    # -------------------------------------------
+    # Access-unit assembly
+    # -------------------------------------------
+    def _emit(self, nal, nal_type):
+        self.au += nal
+        if nal_type == NAL_IDR:
+            self.au_keyframe = True
+        if 1 <= nal_type <= 5:
+            self.au_vcl = True
+            if nal[len(START_CODE)] & 0x60:
+                self.au_reference = True
+
+    def _finish_au(self, out):
+        if not self.au:
+            if self.au_broken:
+                # Every NAL of the picture was lost or incomplete
+                self.frames_dropped += 1
+                self.au_broken = False
+            return
+
+        drop = self.au_broken
+        if self.waiting_for_idr and self.au_vcl:
+            if self.au_keyframe and not self.au_broken:
+                self.waiting_for_idr = False
+            else:
+                drop = True
+
+        if drop:
+            self.frames_dropped += 1
+        else:
+            self.frames_emitted += 1
+            out.append(AccessUnit(bytes(self.au), self.au_timestamp,
+                                  self.au_keyframe, self.au_reference, self.au_vcl))
+
+        self.au = bytearray()
+        self.au_keyframe = False
+        self.au_reference = False
+        self.au_vcl = False
+        self.au_broken = False
+
+    # -------------------------------------------
+    # Depacketization
+    # -------------------------------------------
+    def _process(self, packet, out):
+        marker = packet[1] >> 7
+        timestamp = int.from_bytes(packet[4:8], "big")
+
+        # A new timestamp closes the previous picture even if its marker was lost
+        if timestamp != self.au_timestamp:
+            if self.loss_pending and self.au:
+                self.au_broken = True      # its tail may be gone
+            self._finish_au(out)
+            self.au_timestamp = timestamp
+            self.au_broken = self.loss_pending   # ...or the head of this one
+        elif self.loss_pending:
+            self.au_broken = True
+        self.loss_pending = False
+
+        self._depacketize(packet)
+
+        # Marker bit = last packet of the picture
+        if marker:
+            self._finish_au(out)
+
+    def _depacketize(self, packet):
+        # RTP HEADER (12 bytes + CSRCs + optional extension)
+        offset = 12 + 4 * (packet[0] & 0x0F)
+        if packet[0] & 0x10:
+            if len(packet) < offset + 4:
+                return
+            offset += 4 + 4 * ((packet[offset + 2] << 8) | packet[offset + 3])
+
+        end = len(packet)
+        if packet[0] & 0x20:  # padding
+            end -= packet[-1]
+
+        if end <= offset:
+            return
+        payload = packet[offset:end]
 
         # H264 NAL header (1 byte)
         nal_header = payload[0]
@@ -24,10 +250,23 @@ class H264RTPParser:
         # ---- Case 1: Single NALU ----
         if nal_type > 0 and nal_type < 24:
             # This is a complete NAL unit (SPS, PPS, IDR, etc.)
-            return b"\x00\x00\x00\x01" + payload
+            self._emit(START_CODE + payload, nal_type)
+            return
 
-        # ---- Case 2: FU-A Fragmentation ----
-        if nal_type == 28:  # FU-A
+        # ---- Case 2: STAP-A (several small NALs, e.g. SPS + PPS) ----
+        if nal_type == NAL_STAP_A:
+            i = 1
+            while i + 2 <= len(payload):
+                size = (payload[i] << 8) | payload[i + 1]
+                i += 2
+                if size == 0 or i + size > len(payload):
+                    break
+                self._emit(START_CODE + payload[i:i + size], payload[i] & 0x1F)
+                i += size
+            return
+
+        # ---- Case 3: FU-A Fragmentation ----
+        if nal_type == NAL_FU_A and len(payload) > 2:
             fu_indicator = nal_header
             fu_header = payload[1]
             start_bit = fu_header >> 7
@@ -38,25 +277,35 @@ class H264RTPParser:
 
             # Start of fragmented NAL
             if start_bit == 1:
+                if self.started:
+                    # Previous NAL never got its end fragment
+                    self.nals_discarded += 1
+                    self.au_broken = True
                 self.buffer = bytearray()
-                self.buffer.extend(b"\x00\x00\x00\x01")
+                self.buffer.extend(START_CODE)
                 self.buffer.append(nal_unit_header)
                 self.buffer.extend(payload[2:])
                 self.started = True
-                return None
+                self.fu_counted = False
+                return
+
+            # Middle / end fragment without its start: the NAL is incomplete
+            if not self.started:
+                self.au_broken = True
+                if end_bit == 1:
+                    if not self.fu_counted:
+                        self.nals_discarded += 1
+                    self.fu_counted = False
+                return
 
             # Middle fragment
-            if self.started and start_bit == 0 and end_bit == 0:
+            if end_bit == 0:
                 self.buffer.extend(payload[2:])
-                return None
+                return
 
             # End fragment
-            if self.started and end_bit == 1:
-                self.buffer.extend(payload[2:])
-                self.started = False
-                return bytes(self.buffer)
+            self.buffer.extend(payload[2:])
+            self.started = False
+            self._emit(self.buffer, fu_type)
 
         # Other NAL types ignored
-        return None
-
-
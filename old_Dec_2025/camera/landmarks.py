@@ -0,0 +1,69 @@
+# camera/landmarks.py
+
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+# 5 Landmark Index for Mediapipe FaceMesh (ArcFace order)
+FACEMESH_LANDMARK_IDXS = {
+    "left_eye": 33,
+    "right_eye": 263,
+    "nose": 1,
+    "mouth_left": 61,
+    "mouth_right": 291,
+}
+FIVE_POINT_IDXS = np.array(list(FACEMESH_LANDMARK_IDXS.values()))
+
+_xyz = attrgetter("x", "y", "z")
+
+
+class LandmarkBuffer:
+    """
+    Reusable (max_faces, n_points, 3) float32 buffer for Mediapipe landmarks.
+
+    fill() copies every face's landmarks in one C-level pass per face
+    (map + attrgetter + np.fromiter), so no per-point Python lists are
+    built. Bbox, embedding and 5-point extraction are NumPy reductions
+    over the returned view.
+    """
+
+    def __init__(self, max_faces=5, n_points=478):
+        self.max_faces = max_faces
+        self.n_points = n_points
+        self.pts = np.zeros((max_faces, n_points, 3), dtype=np.float32)
+        self._flat = self.pts.reshape(max_faces, n_points * 3)
+
+    def fill(self, faces):
+        """
+        faces: sequence of per-face landmark lists (objects with .x .y .z)
+        return: (n_faces, n_points, 3) view into the buffer, valid until the next fill
+        """
+        n = min(len(faces), self.max_faces)
+        count = self.n_points * 3
+        for i in range(n):
+            if len(faces[i]) != self.n_points:
+                raise ValueError(f"Expected {self.n_points} landmarks, got {len(faces[i])}")
+            self._flat[i] = np.fromiter(chain.from_iterable(map(_xyz, faces[i])),
+                                        dtype=np.float32, count=count)
+        return self.pts[:n]
+
+
+def embeddings(pts):
+    """(n, n_points, 3) -> (n, n_points * 3) view (no copy)."""
+    return pts.reshape(len(pts), -1)
+
+
+def bboxes(pts, w, h, origin=(0, 0)):
+    """Normalized landmarks -> (n, 4) int boxes x1, y1, x2, y2 in pixels."""
+    scale = np.array([w, h], dtype=np.float32)
+    xy = pts[:, :, :2]
+    mins = xy.min(axis=1) * scale + origin
+    maxs = xy.max(axis=1) * scale + origin
+    return np.concatenate([mins, maxs], axis=1).astype(np.int32)
+
+
+def five_points(pts, w, h, origin=(0, 0)):
+    """Normalized landmarks -> (n, 5, 2) float32 ArcFace 5 points in pixels."""
+    scale = np.array([w, h], dtype=np.float32)
+    return pts[:, FIVE_POINT_IDXS, :2] * scale + np.asarray(origin, dtype=np.float32)
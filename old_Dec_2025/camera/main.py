@@ -1,9 +1,50 @@
 #!/usr/bin/env python3
 # camera/main.py - Docker 진입점
+#
+# The chosen pipeline runs in this process (no second interpreter); only its
+# module is imported, so mediapipe / onnxruntime load only when used.
+
+import startup   # first: startup timer
 
 import os
 import sys
-import subprocess
+import importlib
+
+
+def camera_url(camera, username, password):
+    """Camera entry (IP, IP:PORT or a full rtsp:// URL) -> Hanwha profile2 RTSP URL."""
+    if camera.startswith("rtsp://"):
+        return camera
+    return f"rtsp://{username}:{password}@{camera}/profile2/media.smp"
+
+
+def run_supervisor(mode, cameras, username, password, stride, precision):
+    """Multi-camera mode: one capture process per camera, shared inference workers."""
+    from supervisor import Supervisor
+
+    workers = int(os.getenv("WORKERS", "2"))
+    max_w, max_h = (int(x) for x in os.getenv("MAX_FRAME", "1920x1080").split("x"))
+
+    print(f"CAMERAS: {len(cameras)}")
+    print(f"WORKERS: {workers}")
+    print("=" * 60)
+
+    supervisor = Supervisor(
+        [(f"cam{i}", camera_url(c, username, password)) for i, c in enumerate(cameras)],
+        workers=workers,
+        mode=mode,
+        stride=int(stride),
+        max_shape=(max_h, max_w, 3),
+        gallery_path=os.getenv("GALLERY_PATH"),
+        ivf_min_size=int(os.getenv("IVF_MIN_SIZE", "50000")),
+        threads=int(os.environ["ORT_THREADS"]) if os.getenv("ORT_THREADS") else None,
+        precision=precision,
+    )
+    try:
+        supervisor.run()
+    finally:
+        startup.clear_ready()
+
 
 def main():
     # 환경변수로 설정 읽기
@@ -11,8 +52,13 @@ def main():
     camera_ip = os.getenv("CAMERA_IP", "192.168.1.100")
     username = os.getenv("CAMERA_USER", "admin")
     password = os.getenv("CAMERA_PASSWORD", "Sunap1!!")
-    stride = os.getenv("STRIDE", "2")
+    stride = os.getenv("STRIDE", "2")                  # initial detection interval
+    budget = os.getenv("LATENCY_BUDGET_MS", "200")     # adaptive interval target
+    precision = os.getenv("PRECISION", "fp32")         # int8: quantize_models.py 결과 사용
+    source = os.getenv("SOURCE")                       # recorded .pcap / .h264 / video instead of the camera
     
+    startup.clear_ready()
+
     print("=" * 60)
     print("Face Recognition System - Docker Mode")
     print("=" * 60)
@@ -20,36 +66,56 @@ def main():
     print(f"CAMERA_IP: {camera_ip}")
     print(f"USERNAME: {username}")
     print(f"STRIDE: {stride}")
+    print(f"LATENCY_BUDGET_MS: {budget}")
+    print(f"PRECISION: {precision}")
+    if source:
+        print(f"SOURCE: {source}")
     print("=" * 60)
-    
+
+    # CAMERAS="ip1,ip2:8082,..." -> 한 프로세스에서 여러 카메라 처리
+    cameras = [c.strip() for c in os.getenv("CAMERAS", "").split(",") if c.strip()]
+    if cameras:
+        run_supervisor(mode, cameras, username, password, stride, precision)
+        return
+
     # 실행할 스크립트 선택
     if mode == "insightface":
-        script = "test_opencv_insightface.py"
+        script = "test_opencv_insightface"
     else:
-        script = "test_opencv_mediapipe.py"
+        script = "test_opencv_mediapipe"
     
-    # 명령어 구성
-    cmd = [
-        "python",
-        script,
+    # 인자 구성
+    argv = [
         "--ip", camera_ip,
         "--user", username,
         "--password", password,
         "--stride", stride,
+        "--budget", budget,
         "--headless"  # Docker에서는 항상 headless 모드
     ]
+    if mode == "insightface":
+        argv += ["--precision", precision]
+        if os.getenv("GALLERY_PATH"):
+            argv += ["--gallery", os.getenv("GALLERY_PATH")]   # without it only the detector loads
+            argv += ["--ivf_min_size", os.getenv("IVF_MIN_SIZE", "50000")]
+    if source:
+        argv += ["--source", source]
+        if os.getenv("SOURCE_UNPACED") == "1":
+            argv.append("--unpaced")
     
-    print(f"[INFO] Running: {' '.join(cmd)}")
+    print(f"[INFO] Running: {script}.main({' '.join(argv)})")
     print("=" * 60)
     
-    # 스크립트 실행
+    # 스크립트 실행 (same process)
     try:
-        subprocess.run(cmd, check=True)
+        importlib.import_module(script).main(argv)
     except KeyboardInterrupt:
         print("\n[INFO] Received interrupt signal, shutting down...")
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] Process failed with exit code {e.returncode}")
+    except Exception as e:
+        print(f"[ERROR] Pipeline failed: {e!r}")
         sys.exit(1)
+    finally:
+        startup.clear_ready()
 
 
 if __name__ == "__main__":
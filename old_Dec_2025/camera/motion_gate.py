@@ -0,0 +1,114 @@
+# camera/motion_gate.py
+#
+# Cheap motion gate in front of the face detector.
+#
+# Each frame is shrunk to a tiny grayscale image (160x90 by default) and
+# compared with a running-average background. Only changed regions (or the
+# whole frame, every `refresh` seconds) are handed to the detector, so an
+# empty scene costs one resize + absdiff per frame instead of a detection.
+
+import time
+
+import cv2
+import numpy as np
+
+from roi_detection import merge_overlapping
+
+
+class MotionGate:
+    def __init__(self, size=(160, 90), sensitivity=0.5, min_area=0.002, refresh=2.0,
+                 pad=0.5, max_regions_area=0.5, alpha=0.1):
+        """
+        sensitivity:      0..1, higher = smaller brightness changes count as motion
+        min_area:         smallest changed blob, as a fraction of the frame
+        refresh:          seconds between forced full-frame passes (0 = never)
+        pad:              region padding, as a fraction of the region size
+        max_regions_area: above this fraction of the frame, use the full frame
+        alpha:            background update rate
+        """
+        self.size = size
+        self.threshold = int(round(5 + (1.0 - sensitivity) * 45))
+        self.min_pixels = max(1, int(min_area * size[0] * size[1]))
+        self.refresh = refresh
+        self.pad = pad
+        self.max_regions_area = max_regions_area
+        self.alpha = alpha
+
+        # Preallocated tiny buffers
+        w, h = size
+        self.gray = np.empty((h, w), dtype=np.uint8)
+        self.diff = np.empty((h, w), dtype=np.uint8)
+        self.mask = np.empty((h, w), dtype=np.uint8)
+        self.background_u8 = np.empty((h, w), dtype=np.uint8)
+        self.background = None   # float32 running average
+        self.kernel = np.ones((3, 3), dtype=np.uint8)
+
+        self.last_refresh = 0.0
+        self.frames = 0
+        self.passed = 0          # frames with motion or refresh
+        self.refreshes = 0
+
+    def update(self, img):
+        """
+        img: BGR frame (any size).
+        return: list of (x1, y1, x2, y2) regions of `img` to run the detector
+                on, [] when nothing moved (whole frame on a forced refresh).
+        """
+        self.frames += 1
+        h, w = img.shape[:2]
+        small = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        now = time.monotonic()
+        if self.background is None:
+            self.background = self.gray.astype(np.float32)
+            self.last_refresh = now
+            self.passed += 1
+            self.refreshes += 1
+            return [(0, 0, w, h)]
+
+        cv2.convertScaleAbs(self.background, dst=self.background_u8)
+        cv2.absdiff(self.gray, self.background_u8, dst=self.diff)
+        cv2.accumulateWeighted(self.gray, self.background, self.alpha)
+
+        if self.refresh and now - self.last_refresh >= self.refresh:
+            self.last_refresh = now
+            self.passed += 1
+            self.refreshes += 1
+            return [(0, 0, w, h)]
+
+        cv2.threshold(self.diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self.mask)
+        cv2.dilate(self.mask, self.kernel, dst=self.mask, iterations=2)
+        n, _, blobs, _ = cv2.connectedComponentsWithStats(self.mask, connectivity=8)
+
+        # blobs: (n, 5) x, y, width, height, area; label 0 is the background
+        blobs = blobs[1:]
+        blobs = blobs[blobs[:, 4] >= self.min_pixels]
+        if len(blobs) == 0:
+            return []
+
+        self.passed += 1
+        regions = self._regions(blobs, w / self.size[0], h / self.size[1], w, h)
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        if area > self.max_regions_area * w * h:
+            return [(0, 0, w, h)]
+        return regions
+
+    def _regions(self, blobs, sx, sy, w, h):
+        """Scale blobs to frame coordinates, pad them and merge overlaps."""
+        x, y, bw, bh = (blobs[:, i].astype(np.float32) for i in range(4))
+        px, py = bw * self.pad + 1, bh * self.pad + 1
+        boxes = np.stack([
+            np.clip((x - px) * sx, 0, w), np.clip((y - py) * sy, 0, h),
+            np.clip((x + bw + px) * sx, 0, w), np.clip((y + bh + py) * sy, 0, h),
+        ], axis=1).astype(np.int32).tolist()
+        return merge_overlapping(boxes)
+
+    @property
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "passed": self.passed,
+            "refreshes": self.refreshes,
+            "pass_rate": self.passed / self.frames if self.frames else 0.0,
+        }
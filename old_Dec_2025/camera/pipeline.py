@@ -0,0 +1,204 @@
+# camera/pipeline.py
+#
+# Staged multi-threaded pipeline (capture -> detect -> recognize -> sink).
+#
+#   [ source thread ] -> queue -> [ stage thread ] -> queue -> ... -> results()
+#
+# Every stage runs in its own thread and hands items on through a bounded
+# queue with an explicit drop policy:
+#   "latest": a full queue drops its oldest item (capture never waits on inference)
+#   "block":  the producer waits for room (nothing is lost, backpressure upstream)
+
+import time
+import threading
+from collections import deque
+
+END = object()     # end-of-stream marker, never dropped
+_EMPTY = object()  # get() timed out
+
+
+class StageQueue:
+    def __init__(self, maxsize=2, policy="latest"):
+        if policy not in ("latest", "block"):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        with self.cond:
+            if item is not END and len(self.items) >= self.maxsize:
+                if self.policy == "latest":
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    self.cond.wait_for(lambda: len(self.items) < self.maxsize or self.closed)
+                    if self.closed:
+                        return
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout):
+                return _EMPTY
+            if not self.items:
+                return END
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class Stage:
+    """One worker: fn(item) -> result (None = nothing to pass downstream)."""
+
+    def __init__(self, name, fn, in_queue, out_queue):
+        self.name = name
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.thread = None
+
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            item = self.in_queue.get(timeout=0.1)
+            if item is _EMPTY:
+                continue
+            if item is END:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"[ERROR] Stage '{self.name}' failed: {e}")
+                continue
+            finally:
+                self.busy += time.perf_counter() - start
+
+            self.processed += 1
+            if result is not None:
+                self.out_queue.put(result)
+
+        self.out_queue.put(END)
+
+
+class SourceStage(Stage):
+    """Pulls items from an iterable (e.g. a frame generator) in its own thread."""
+
+    def __init__(self, name, iterable, out_queue):
+        super().__init__(name, None, None, out_queue)
+        self.iterable = iterable
+
+    def run(self, stop_event):
+        it = iter(self.iterable)
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            except Exception as e:
+                self.errors += 1
+                print(f"[ERROR] Source '{self.name}' failed: {e}")
+                break
+            finally:
+                self.busy += time.perf_counter() - start
+
+            self.processed += 1
+            self.out_queue.put(item)
+
+        self.out_queue.put(END)
+
+
+class Pipeline:
+    def __init__(self):
+        self.stages = []
+        self.queues = []
+        self.stop_event = threading.Event()
+        self.started_at = None
+
+    def _new_queue(self, maxsize, policy):
+        q = StageQueue(maxsize, policy)
+        self.queues.append(q)
+        return q
+
+    def add_source(self, name, iterable, maxsize=2, policy="latest"):
+        """maxsize/policy configure the queue *after* this stage."""
+        if self.stages:
+            raise RuntimeError("The source must be the first stage.")
+        self.stages.append(SourceStage(name, iterable, self._new_queue(maxsize, policy)))
+        return self
+
+    def add_stage(self, name, fn, maxsize=2, policy="latest"):
+        if not self.stages:
+            raise RuntimeError("add_source() must run before add_stage().")
+        in_queue = self.stages[-1].out_queue
+        self.stages.append(Stage(name, fn, in_queue, self._new_queue(maxsize, policy)))
+        return self
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for stage in self.stages:
+            stage.thread = threading.Thread(target=stage.run, args=(self.stop_event,),
+                                            name=stage.name, daemon=True)
+            stage.thread.start()
+        return self
+
+    def results(self, timeout=0.1):
+        """
+        Iterate over the last stage's output in the caller's thread (the sink,
+        e.g. cv2.imshow which must stay on the main thread). Yields None when
+        nothing arrived within `timeout` so the caller can keep its UI alive.
+        """
+        out = self.stages[-1].out_queue
+        while not self.stop_event.is_set():
+            item = out.get(timeout)
+            if item is END:
+                return
+            yield None if item is _EMPTY else item
+
+    def stop(self):
+        self.stop_event.set()
+        for q in self.queues:
+            q.close()
+        for stage in self.stages:
+            if stage.thread is not None:
+                stage.thread.join(timeout=2.0)
+
+    def stats(self):
+        """Per-stage throughput counters."""
+        elapsed = max(time.perf_counter() - (self.started_at or time.perf_counter()), 1e-9)
+        report = {}
+        for stage in self.stages:
+            report[stage.name] = {
+                "processed": stage.processed,
+                "fps": stage.processed / elapsed,
+                "avg_ms": stage.busy / stage.processed * 1000.0 if stage.processed else 0.0,
+                "errors": stage.errors,
+                "dropped": stage.out_queue.dropped,
+                "queued": len(stage.out_queue),
+            }
+        return report
+
+    def format_stats(self):
+        return " | ".join(
+            f"{name}: {s['fps']:.1f}fps {s['avg_ms']:.1f}ms drop={s['dropped']}"
+            for name, s in self.stats().items()
+        )
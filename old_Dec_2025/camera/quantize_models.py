@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# camera/quantize_models.py
+# INT8 copies of the pack's detector / recognizer for CPU inference
+#
+#   static  (default): QDQ, weights + activations INT8, ranges calibrated on
+#                      local images (--calib). Best for the conv-heavy models.
+#   dynamic:           weights INT8, activation ranges computed at run time.
+#                      No calibration set needed, smaller gain on convs.
+#
+# Output next to the originals: det_10g.int8.onnx, w600k_r50.int8.onnx, ...
+# Load them with RecognitionEngine(precision="int8") / --precision int8.
+
+import os
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quant_pre_process, quantize_dynamic, quantize_static)
+
+from alignment import FaceAligner
+from recognition_engine import MODEL_FILES, RecognitionEngine, arcface_blob, model_file, pack_dir
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def list_images(root):
+    """Image files under `root` (recursive, sorted)."""
+    paths = []
+    for dirpath, _, names in os.walk(root):
+        paths += [os.path.join(dirpath, n) for n in names if n.lower().endswith(IMAGE_EXTS)]
+    return sorted(paths)
+
+
+def detector_blob(img, size=(320, 320)):
+    """BGR image -> (1, 3, h, w) detector input, letterboxed like SCRFD detect()."""
+    w, h = size
+    scale = min(w / img.shape[1], h / img.shape[0])
+    resized = cv2.resize(img, (int(img.shape[1] * scale), int(img.shape[0] * scale)))
+    canvas = np.zeros((h, w, 3), dtype=np.uint8)
+    canvas[:resized.shape[0], :resized.shape[1]] = resized
+    return cv2.dnn.blobFromImage(canvas, 1.0 / 128.0, (w, h), (127.5, 127.5, 127.5), swapRB=True)
+
+
+def face_crops(images, engine=None):
+    """
+    Aligned 112x112 crops for the recognizer. 112x112 images are taken as
+    already aligned; otherwise the largest face found by `engine` is used.
+    return: ((n, 112, 112, 3) uint8, source image index per crop)
+    """
+    aligner = FaceAligner(max_faces=1)
+    crops, sources = [], []
+    for i, img in enumerate(images):
+        if img.shape[:2] == (112, 112):
+            crops.append(img)
+        else:
+            boxes, _, kps = engine.detect(img)
+            if len(boxes) == 0 or kps is None:
+                continue
+            largest = np.argmax((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))
+            batch, valid = aligner.align(img, kps[largest:largest + 1])
+            if not valid[0]:
+                continue
+            crops.append(batch[0].copy())
+        sources.append(i)
+    return np.array(crops, dtype=np.uint8).reshape(-1, 112, 112, 3), sources
+
+
+class BlobReader(CalibrationDataReader):
+    def __init__(self, input_name, blobs):
+        self.input_name = input_name
+        self.blobs = iter(blobs)
+
+    def get_next(self):
+        blob = next(self.blobs, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+def quantize(src, dst, mode="static", blobs=None, per_channel=True):
+    if mode == "dynamic":
+        # ConvInteger on CPU needs uint8 weights
+        quantize_dynamic(src, dst, weight_type=QuantType.QUInt8, per_channel=per_channel)
+        return
+
+    input_name = ort.InferenceSession(src, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, "prepared.onnx")
+        quant_pre_process(src, prepared)   # shape inference + graph cleanup before calibration
+        quantize_static(prepared, dst, BlobReader(input_name, blobs),
+                        quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.MinMax)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize InsightFace models to INT8")
+    parser.add_argument("--pack", default="buffalo_l")
+    parser.add_argument("--root", default="~/.insightface")
+    parser.add_argument("--models", nargs="+", choices=["detection", "recognition"],
+                        default=["detection", "recognition"])
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--calib", default=None, help="Calibration image directory (required for static)")
+    parser.add_argument("--calib_count", type=int, default=200, help="Images used for calibration")
+    parser.add_argument("--det_size", type=int, default=320, help="Detector input size used for calibration")
+    parser.add_argument("--no_per_channel", action="store_true", help="Per-tensor weight scales")
+    args = parser.parse_args()
+
+    if args.mode == "static" and not args.calib:
+        parser.error("--calib is required for static quantization")
+
+    model_dir = pack_dir(args.pack, args.root)
+    per_channel = not args.no_per_channel
+
+    images = []
+    if args.mode == "static":
+        paths = list_images(args.calib)
+        if args.calib_count and len(paths) > args.calib_count:
+            # Spread over the whole set (directories are usually per person / camera)
+            paths = [paths[i] for i in np.linspace(0, len(paths) - 1, args.calib_count).astype(int)]
+        images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+        print(f"[INFO] Calibration images: {len(images)} from {args.calib}")
+        if not images:
+            print("[ERROR] No readable calibration images")
+            return
+
+    for module in args.models:
+        name = MODEL_FILES[args.pack][module]
+        src = os.path.join(model_dir, name)
+        dst = os.path.join(model_dir, model_file(name, "int8"))
+
+        blobs = None
+        if args.mode == "static":
+            if module == "detection":
+                blobs = [detector_blob(img, (args.det_size, args.det_size)) for img in images]
+            else:
+                engine = RecognitionEngine(args.pack, args.root, modules=("detection",),
+                                           det_size=(args.det_size, args.det_size))
+                crops, _ = face_crops(images, engine)
+                print(f"[INFO] Aligned faces for recognizer calibration: {len(crops)}")
+                if len(crops) == 0:
+                    print(f"[ERROR] No faces found, skipping {name}")
+                    continue
+                blobs = [arcface_blob(crops[i:i + 1]) for i in range(len(crops))]
+
+        print(f"[INFO] Quantizing {name} ({args.mode}) -> {os.path.basename(dst)}")
+        quantize(src, dst, args.mode, blobs, per_channel)
+        print(f"[INFO]   {os.path.getsize(src) / 1e6:.1f} MB -> {os.path.getsize(dst) / 1e6:.1f} MB")
+
+    print("[INFO] Done. Benchmark with: python bench_quantization.py --images <labelled dir>")
+
+
+if __name__ == "__main__":
+    main()
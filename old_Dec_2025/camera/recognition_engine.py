@@ -0,0 +1,183 @@
+# camera/recognition_engine.py
+#
+# Lean replacement for insightface's FaceAnalysis.
+#
+# FaceAnalysis opens an ONNX Runtime session for every model of the pack
+# (detection, 2D/3D landmarks, gender/age, recognition) and app.get() runs
+# all of them on every face. This engine opens only what a pipeline uses:
+#
+#   modules=("detection",)                 track-only frames / no gallery
+#   modules=("detection", "recognition")   detect + embed pre-aligned batches
+#
+# Each session gets its own intra/inter-op thread counts, so worker threads
+# or processes can split the CPU cores instead of oversubscribing them.
+# precision="int8" loads the *.int8.onnx files written by quantize_models.py.
+
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+# Model files per insightface pack (~/.insightface/models/<pack>/)
+MODEL_FILES = {
+    "buffalo_l": {"detection": "det_10g.onnx", "recognition": "w600k_r50.onnx"},
+    "buffalo_m": {"detection": "det_2.5g.onnx", "recognition": "w600k_r50.onnx"},
+    "buffalo_s": {"detection": "det_500m.onnx", "recognition": "w600k_mbf.onnx"},
+    "buffalo_sc": {"detection": "det_500m.onnx", "recognition": "w600k_mbf.onnx"},
+}
+PRECISIONS = ("fp32", "int8")
+
+
+def model_file(name, precision="fp32"):
+    """det_10g.onnx -> det_10g.int8.onnx for precision="int8"."""
+    if precision == "fp32":
+        return name
+    return name[:-len(".onnx")] + f".{precision}.onnx"
+
+
+def session_options(intra_threads=0, inter_threads=0):
+    """0 = let ONNX Runtime decide (all cores)."""
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.intra_op_num_threads = intra_threads
+    opts.inter_op_num_threads = inter_threads
+    if inter_threads > 1:
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return opts
+
+
+def pack_dir(pack="buffalo_l", root="~/.insightface"):
+    """Model directory of an insightface pack, downloaded on first use."""
+    path = os.path.join(os.path.expanduser(root), "models", pack)
+    if not os.path.isdir(path):
+        from insightface.utils import ensure_available
+        path = ensure_available("models", pack, root=root)
+    return path
+
+
+def arcface_blob(batch, input_mean=127.5, input_std=127.5):
+    """(n, 112, 112, 3) uint8 BGR crops -> (n, 3, 112, 112) float32 normalized RGB."""
+    blob = batch[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32)
+    blob -= input_mean
+    blob /= input_std
+    return blob
+
+
+class ArcFaceEncoder:
+    def __init__(self, session, input_mean=127.5, input_std=127.5):
+        """ArcFace on pre-aligned 112x112 BGR crops (buffalo packs: mean/std 127.5, RGB input)."""
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.output_name = session.get_outputs()[0].name
+        self.input_mean = input_mean
+        self.input_std = input_std
+        self.dim = session.get_outputs()[0].shape[-1]
+
+    def __call__(self, batch):
+        """
+        batch: (n, 112, 112, 3) uint8 BGR (e.g. FaceAligner.align())
+        return: (n, dim) float32 embeddings (not normalized)
+        """
+        if len(batch) == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        blob = arcface_blob(batch, self.input_mean, self.input_std)
+        return self.session.run([self.output_name], {self.input_name: blob})[0]
+
+
+class RecognitionEngine:
+    def __init__(self, pack="buffalo_l", root="~/.insightface", modules=("detection", "recognition"),
+                 det_size=(320, 320), det_thresh=0.5, det_threads=(0, 0), rec_threads=(0, 0),
+                 providers=("CPUExecutionProvider",), precision="fp32"):
+        """
+        modules:     subset of ("detection", "recognition") to load
+        precision:   "fp32" or "int8" (quantized copies, fp32 fallback per model)
+        det_size:    detector input size for full frames
+        det_threads: (intra, inter) op threads of the detector session
+        rec_threads: (intra, inter) op threads of the recognizer session
+        """
+        self.pack = pack
+        self.modules = tuple(modules)
+        self.det_size = tuple(det_size)
+        self.providers = list(providers)
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+        self.precision = precision
+        self.precisions = {}   # module -> precision actually loaded
+        self.model_dir = pack_dir(pack, root)
+        self.load_times = {}
+        self.warmup_time = None
+
+        self.detector = None
+        self.encoder = None
+
+        if "detection" in self.modules:
+            # SCRFD anchors / decoding / NMS from insightface, on our own session
+            from insightface.model_zoo.retinaface import RetinaFace
+            path = self._model_path("detection")
+            self.detector = RetinaFace(model_file=path, session=self._session("detection", path, det_threads))
+            self.detector.det_thresh = det_thresh
+            if self.detector.input_size is None:   # dynamic input (det_10g): no prepare() needed
+                self.detector.input_size = self.det_size
+
+        if "recognition" in self.modules:
+            path = self._model_path("recognition")
+            self.encoder = ArcFaceEncoder(self._session("recognition", path, rec_threads))
+
+    def _model_path(self, module):
+        name = MODEL_FILES[self.pack][module]
+        path = os.path.join(self.model_dir, model_file(name, self.precision))
+        self.precisions[module] = self.precision
+        if self.precision != "fp32" and not os.path.exists(path):
+            print(f"[WARNING] {os.path.basename(path)} not found (run quantize_models.py), using fp32 {name}")
+            path = os.path.join(self.model_dir, name)
+            self.precisions[module] = "fp32"
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{module} model not found: {path}")
+        return path
+
+    def _session(self, module, path, threads):
+        start = time.perf_counter()
+        session = ort.InferenceSession(path, sess_options=session_options(*threads), providers=self.providers)
+        self.load_times[module] = time.perf_counter() - start
+        return session
+
+    @property
+    def can_recognize(self):
+        return self.encoder is not None
+
+    def detect(self, img, input_size=None, max_num=0):
+        """
+        img: BGR frame (or crop)
+        input_size: detector input (w, h), default det_size
+        return: (boxes (n, 4), scores (n,), kps (n, 5, 2) or None) in `img` pixels
+        """
+        dets, kpss = self.detector.detect(img, input_size=input_size, max_num=max_num, metric="default")
+        return dets[:, :4], dets[:, 4], kpss
+
+    def embed(self, batch):
+        """(n, 112, 112, 3) aligned BGR crops -> (n, 512) embeddings, one session run."""
+        if self.encoder is None:
+            raise RuntimeError(f"Recognition model not loaded (modules={self.modules})")
+        return self.encoder(batch)
+
+    def warmup(self, det_sizes=(), batch_sizes=(1,)):
+        """
+        One dummy run per input shape, so the first real frame does not pay
+        for ONNX Runtime's lazy allocations / kernel selection.
+        det_sizes: extra detector input sizes (e.g. the ROI size)
+        """
+        start = time.perf_counter()
+        if self.detector is not None:
+            for w, h in (self.det_size,) + tuple(det_sizes):
+                self.detect(np.zeros((h, w, 3), dtype=np.uint8), input_size=(w, h))
+        if self.encoder is not None:
+            for n in batch_sizes:
+                self.encoder(np.zeros((n, 112, 112, 3), dtype=np.uint8))
+        self.warmup_time = time.perf_counter() - start
+
+    def describe(self):
+        loaded = ", ".join(f"{m} {self.precisions[m]} {t * 1000:.0f}ms" for m, t in self.load_times.items())
+        if self.warmup_time is not None:
+            loaded += f", warmup {self.warmup_time * 1000:.0f}ms"
+        return f"{self.pack} [{loaded}]"
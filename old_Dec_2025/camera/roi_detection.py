@@ -0,0 +1,130 @@
+# camera/roi_detection.py
+#
+# Detection focused on where the faces are.
+#
+#   every frame:   detector on padded full-resolution crops around the
+#                  predicted track boxes (small / distant faces stay sharp)
+#   sweep frames:  cheap low-res full-frame pass to catch new entrants
+#
+# Cost scales with the number of tracked people instead of the frame area.
+
+import numpy as np
+
+from tracker import iou_matrix
+
+
+def merge_overlapping(boxes):
+    """Merge overlapping (x1, y1, x2, y2) boxes into their union until none overlap."""
+    boxes = [list(b) for b in boxes]
+    merged = True
+    while merged and len(boxes) > 1:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(b) for b in boxes]
+
+
+def nms(boxes, scores, iou_threshold=0.4):
+    """Greedy non-maximum suppression. return: kept indices, best score first."""
+    order = np.argsort(-np.asarray(scores))
+    iou = iou_matrix(boxes, boxes)
+    keep = []
+    suppressed = np.zeros(len(order), dtype=bool)
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= iou[i] > iou_threshold
+    return np.array(keep, dtype=np.int64)
+
+
+def track_rois(track_boxes, w, h, pad=0.6, min_size=96):
+    """
+    Padded crops around predicted face boxes, clipped to the frame and
+    merged where they overlap. return: list of int (x1, y1, x2, y2)
+    """
+    rois = []
+    for x1, y1, x2, y2 in np.asarray(track_boxes, dtype=np.float32).reshape(-1, 4):
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half = max(max(x2 - x1, y2 - y1) * (1 + 2 * pad), min_size) / 2
+        rx1, ry1 = int(max(cx - half, 0)), int(max(cy - half, 0))
+        rx2, ry2 = int(min(cx + half, w)), int(min(cy + half, h))
+        if rx2 - rx1 > 1 and ry2 - ry1 > 1:
+            rois.append((rx1, ry1, rx2, ry2))
+    return merge_overlapping(rois)
+
+
+class ROIDetector:
+    def __init__(self, detect_fn, pad=0.6, min_size=96, nms_iou=0.4):
+        """
+        detect_fn(crop) -> (boxes (n, 4), scores (n,), kps (n, k, 2) or None) in crop pixels
+        pad:            crop margin around a track, in face sizes per side
+        min_size:       smallest crop side in pixels (detector needs some context)
+        nms_iou:        overlap at which two detections are the same face
+        """
+        self.detect_fn = detect_fn
+        self.pad = pad
+        self.min_size = min_size
+        self.nms_iou = nms_iou
+
+        self.sweeps = 0
+        self.roi_calls = 0
+        self.roi_pixels = 0
+        self.frames = 0
+
+    def detect(self, img, track_boxes=(), sweep=None):
+        """
+        track_boxes: predicted boxes of the current tracks (full-frame pixels)
+        sweep:       (boxes, scores, kps) of this frame's low-res full-frame
+                     pass in full-frame pixels, if one ran; merged in
+        return: (boxes (n, 4), scores (n,), kps or None) in full-frame pixels
+        """
+        self.frames += 1
+        h, w = img.shape[:2]
+        parts = []
+
+        if sweep is not None:
+            self.sweeps += 1
+            parts.append(sweep)
+
+        for x1, y1, x2, y2 in track_rois(track_boxes, w, h, self.pad, self.min_size):
+            boxes, scores, kps = self.detect_fn(img[y1:y2, x1:x2])
+            self.roi_calls += 1
+            self.roi_pixels += (x2 - x1) * (y2 - y1)
+            if len(boxes):
+                offset = np.array([x1, y1], dtype=np.float32)
+                boxes = np.asarray(boxes, dtype=np.float32)[:, :4] + np.tile(offset, 2)
+                if kps is not None:
+                    kps = np.asarray(kps, dtype=np.float32) + offset
+            parts.append((boxes, scores, kps))
+
+        parts = [p for p in parts if len(p[0])]
+        if not parts:
+            return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), None
+
+        boxes = np.concatenate([np.asarray(p[0], dtype=np.float32)[:, :4] for p in parts])
+        scores = np.concatenate([np.asarray(p[1], dtype=np.float32) for p in parts])
+        kps = None
+        if all(p[2] is not None for p in parts):
+            kps = np.concatenate([np.asarray(p[2], dtype=np.float32) for p in parts])
+
+        # A face seen by the sweep and its ROI (or by two ROIs) is kept once
+        keep = nms(boxes, scores, self.nms_iou)
+        return boxes[keep], scores[keep], kps[keep] if kps is not None else None
+
+    @property
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "sweeps": self.sweeps,
+            "roi_calls": self.roi_calls,
+            "roi_pixels_per_frame": self.roi_pixels / self.frames if self.frames else 0.0,
+        }
@@ -0,0 +1,316 @@
+# camera/rtsp_session.py
+#
+# Reconnect handling for flaky camera links.
+#
+#   ReconnectingSession: RTSPClient + cached SDP / track URI / digest state.
+#                        A reconnect goes straight to authenticated SETUP -> PLAY
+#                        (no OPTIONS / 401 / DESCRIBE round trips).
+#   ReconnectingCapture: cv2.VideoCapture drop-in that reopens the stream.
+#
+# Both retry with jittered exponential backoff and record the time from a
+# detected drop to the first frame after it (time-to-first-frame, "ttff").
+
+import re
+import time
+import random
+from abc import ABC, abstractmethod
+from collections import deque
+
+from rtsp_client import RTSPClient
+
+
+def backoff_delays(base=0.5, cap=30.0, factor=2.0):
+    """
+    Jittered exponential backoff: the n-th delay is drawn from
+    [d/2, d] with d = min(cap, base * factor**n), so many cameras dropped
+    by the same outage do not reconnect in lockstep.
+    """
+    delay = base
+    while True:
+        yield delay / 2 + random.uniform(0, delay / 2)
+        delay = min(cap, delay * factor)
+
+
+def check_response(resp, method):
+    m = re.match(r"RTSP/\d\.\d (\d+)", resp)
+    if not m or m.group(1) != "200":
+        raise RuntimeError(f"{method} failed: {resp.splitlines()[0] if resp else 'no response'}")
+    return resp
+
+
+class Reconnecting(ABC):
+    """Backoff loop and reconnect metrics; subclasses implement _open() / _close()."""
+
+    def __init__(self, name, base_delay=0.5, max_delay=30.0, stop_event=None):
+        """stop_event: threading / multiprocessing Event that also ends the backoff loop"""
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stop_event = stop_event
+        self.stopped = False
+
+        self.connects = 0
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.down_since = None          # monotonic time the current outage started
+        self.downtime = 0.0             # drop -> first frame, summed over outages
+        self.ttff = deque(maxlen=100)   # recent time-to-first-frame after reconnect
+
+    @abstractmethod
+    def _open(self):
+        """Open the stream, raise on failure."""
+
+    @abstractmethod
+    def _close(self):
+        """Release the stream (no-op if not open)."""
+
+    @property
+    def stopping(self):
+        return self.stopped or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _sleep(self, delay):
+        # Wakes up as soon as stop_event is set (shutdown does not wait out the backoff)
+        if self.stop_event is not None:
+            self.stop_event.wait(delay)
+        else:
+            time.sleep(delay)
+
+    def _connect(self):
+        """Call _open() until it succeeds (False if stopped meanwhile)."""
+        delays = backoff_delays(self.base_delay, self.max_delay)
+        while not self.stopping:
+            try:
+                self._open()
+                self.connects += 1
+                return True
+            except Exception as e:
+                self.failed_attempts += 1
+                delay = next(delays)
+                print(f"[WARNING] [{self.name}] Connect failed ({e}), retrying in {delay:.1f}s")
+                self._sleep(delay)
+        return False
+
+    def _reconnect(self, reason):
+        print(f"[WARNING] [{self.name}] Stream lost ({reason}), reconnecting...")
+        self._close()
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+        self.reconnects += 1
+        return self._connect()
+
+    def mark_frame(self):
+        """Call when a decoded frame comes out; closes the current outage."""
+        if self.down_since is None:
+            return
+        ttff = time.monotonic() - self.down_since
+        self.down_since = None
+        self.ttff.append(ttff)
+        self.downtime += ttff
+        print(f"[INFO] [{self.name}] First frame {ttff:.2f}s after the drop")
+
+    @property
+    def stats(self):
+        return {
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "failed_attempts": self.failed_attempts,
+            "ttff_last": self.ttff[-1] if self.ttff else None,
+            "ttff_avg": sum(self.ttff) / len(self.ttff) if self.ttff else None,
+            "downtime": self.downtime,
+        }
+
+
+# -------------------------------------------
+# RTSPClient session with cached state
+# -------------------------------------------
+class ReconnectingSession(Reconnecting):
+    def __init__(self, url, transport="udp", batch_size=64, stall_timeout=5.0,
+                 on_reconnect=None, base_delay=0.5, max_delay=30.0, verbose=False, stop_event=None):
+        """
+        stall_timeout: seconds without any RTP packet before the stream counts as lost
+        on_reconnect:  called after every reconnect (reset RTP parser / decoder:
+                       sequence numbers and timestamps start over)
+        """
+        super().__init__("RTSP", base_delay, max_delay, stop_event)
+        self.url = url
+        self.transport = transport
+        self.batch_size = batch_size
+        self.stall_timeout = stall_timeout
+        self.on_reconnect = on_reconnect
+        self.verbose = verbose
+
+        self.client = None
+        self.cache = None        # sdp, track URI, digest realm/nonce/qop/cnonce/nc
+        self.fast_reconnects = 0
+        self.last_packet = time.monotonic()
+
+    def _new_client(self):
+        client = RTSPClient(self.url, verbose=self.verbose, transport=self.transport)
+        client.connect(timeout=self.stall_timeout)
+        return client
+
+    def _open_full(self):
+        client = self._new_client()
+        try:
+            check_response(client.options(), "OPTIONS")
+            check_response(client.describe(), "DESCRIBE")
+            check_response(client.setup(), "SETUP")
+            check_response(client.play(), "PLAY")
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    def _open_cached(self):
+        """Reuse the DESCRIBE result and digest challenge: SETUP -> PLAY only."""
+        client = self._new_client()
+        c = self.cache
+        client.sdp = c["sdp"]
+        client.video_track_uri = c["track"]
+        client.realm, client.nonce, client.qop = c["realm"], c["nonce"], c["qop"]
+        client.cnonce, client.nc = c["cnonce"], c["nc"]
+        try:
+            # A stale nonce gets a 401, which _send_rtsp answers with the new one
+            check_response(client.setup(), "SETUP")
+            check_response(client.play(), "PLAY")
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    def _open(self):
+        client = None
+        if self.cache is not None:
+            try:
+                client = self._open_cached()
+                self.fast_reconnects += 1
+            except Exception as e:
+                print(f"[WARNING] [{self.name}] Cached SETUP failed ({e}), doing full DESCRIBE")
+        if client is None:
+            client = self._open_full()
+
+        client.open_rtp_socket(batch_size=self.batch_size)
+        self.client = client
+        self.cache = {
+            "sdp": client.sdp, "track": client.video_track_uri,
+            "realm": client.realm, "nonce": client.nonce, "qop": client.qop,
+            "cnonce": client.cnonce, "nc": client.nc,
+        }
+        self.last_packet = time.monotonic()
+
+    def _close(self):
+        if self.client is not None:
+            self.cache["nc"] = self.client.nc
+            self.client.close()
+            self.client = None
+
+    def _reconnect(self, reason):
+        if not super()._reconnect(reason):
+            return False
+        if self.on_reconnect is not None:
+            self.on_reconnect()
+        return True
+
+    def packets(self, timeout=1.0):
+        """
+        Yield RTP packets forever, reconnecting after socket errors or
+        `stall_timeout` seconds of silence. Packets are memoryviews into the
+        receive buffers (see RTSPClient.receive_rtp_batch): consume each one
+        before asking for the next.
+        """
+        if self.client is None and not self._connect():
+            return
+
+        while not self.stopping:
+            try:
+                batch = self.client.receive_rtp_batch(timeout)
+            except OSError as e:
+                self._reconnect(f"receive failed: {e}")
+                continue
+
+            now = time.monotonic()
+            if not batch:
+                if now - self.last_packet >= self.stall_timeout:
+                    self._reconnect(f"no RTP for {now - self.last_packet:.1f}s")
+                continue
+
+            self.last_packet = now
+            yield from batch
+
+    def close(self):
+        self.stopped = True
+        self._close()
+
+    @property
+    def stats(self):
+        stats = super().stats
+        stats["fast_reconnects"] = self.fast_reconnects
+        return stats
+
+
+# -------------------------------------------
+# OpenCV VideoCapture with reconnect
+# -------------------------------------------
+class ReconnectingCapture(Reconnecting):
+    """
+    Drop-in for cv2.VideoCapture(url, cv2.CAP_FFMPEG): after `max_failures`
+    failed reads in a row the stream is reopened with backoff. Properties
+    set with set() are applied again on every reopen.
+    """
+
+    def __init__(self, url, max_failures=5, name="capture", base_delay=0.5, max_delay=30.0, stop_event=None):
+        super().__init__(name, base_delay, max_delay, stop_event)
+        self.url = url
+        self.max_failures = max_failures
+        self.props = {}
+        self.cap = None
+        self.failed_reads = 0
+
+        # Single attempt like VideoCapture(); check isOpened()
+        try:
+            self._open()
+            self.connects += 1
+        except RuntimeError:
+            pass
+
+    def _open(self):
+        import cv2
+        cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        if not cap.isOpened():
+            cap.release()
+            raise RuntimeError("VideoCapture failed to open")
+        for prop, value in self.props.items():
+            cap.set(prop, value)
+        self.cap = cap
+        self.failed_reads = 0
+
+    def _close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def set(self, prop, value):
+        self.props[prop] = value
+        return self.cap.set(prop, value) if self.cap is not None else False
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        if self.cap is None and not self._reconnect("not open"):
+            return False, None
+
+        ret, img = self.cap.read()
+        if ret:
+            self.failed_reads = 0
+            self.mark_frame()
+            return ret, img
+
+        self.failed_reads += 1
+        if self.failed_reads >= self.max_failures:
+            self._reconnect(f"{self.failed_reads} failed reads")
+        return False, None
+
+    def release(self):
+        self.stopped = True
+        self._close()
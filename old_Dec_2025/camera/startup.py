@@ -0,0 +1,41 @@
+# camera/startup.py
+#
+# Startup timing + readiness marker.
+#
+# Imported first by main.py (or by a script run on its own), so STARTED is
+# close to process start. mark_ready() logs the time to the first processed
+# frame once and touches $READY_FILE (Docker HEALTHCHECK: test -f).
+
+import os
+import time
+
+STARTED = time.monotonic()
+_ready = False
+
+
+def elapsed():
+    return time.monotonic() - STARTED
+
+
+def log_step(name):
+    print(f"[INFO] Startup: {name} (+{elapsed():.2f}s)")
+
+
+def clear_ready():
+    """Remove a marker left by a previous run (container restart)."""
+    path = os.getenv("READY_FILE")
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def mark_ready(what="first frame processed"):
+    global _ready
+    if _ready:
+        return
+    _ready = True
+    print(f"[INFO] ✅ Ready: {what} {elapsed():.2f}s after start")
+
+    path = os.getenv("READY_FILE")
+    if path:
+        with open(path, "w") as f:
+            f.write(f"{time.time():.3f} {elapsed():.3f}\n")
@@ -0,0 +1,388 @@
+# camera/supervisor.py
+#
+# One supervisor process for many cameras:
+#
+#   [capture proc cam0] --\                         /--> [inference worker 0]
+#   [capture proc cam1] ----> shared-memory rings --+--> [inference worker 1]
+#   [capture proc camN] --/   + tiny descriptors    \--> [inference worker M]
+#
+# Capture processes only read/decode their stream and copy frames into their
+# own multiprocessing.shared_memory ring. Only (camera, slot, seq) descriptors
+# travel through the queue, never pickled frames. Every inference worker loads
+# its models once and serves all cameras.
+
+import os
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import startup
+from rtsp_session import ReconnectingCapture
+
+HEADER_FIELDS = 4   # per slot: seq, height, width, channels
+RESTART_BACKOFF = (1.0, 60.0)   # first / longest delay between restarts of a crashing process
+
+
+class SharedFrameRing:
+    """
+    Fixed ring of frame slots in one shared-memory block.
+
+    Each slot has a seqlock: the writer makes its sequence odd while copying
+    and even when done, so a reader can tell if the slot was overwritten
+    while it was being copied.
+    """
+
+    def __init__(self, name, n_slots, max_shape, create=False):
+        self.n_slots = n_slots
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        header_bytes = n_slots * HEADER_FIELDS * 8
+
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=header_bytes + n_slots * self.slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.name = self.shm.name
+        self.header = np.ndarray((n_slots, HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((n_slots, self.slot_bytes), dtype=np.uint8,
+                               buffer=self.shm.buf, offset=header_bytes)
+        if create:
+            self.header[:] = 0
+        self.next_slot = 0
+
+    def write(self, frame):
+        """Copy a frame into the next slot. return: (slot, seq) descriptor."""
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {frame.shape} larger than ring slot {self.max_shape}")
+
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.n_slots
+        hdr = self.header[slot]
+
+        hdr[0] += 1                       # odd: write in progress
+        self.data[slot, :frame.nbytes] = frame.reshape(-1)
+        hdr[1:] = frame.shape
+        hdr[0] += 1                       # even: slot is consistent
+        return slot, int(hdr[0])
+
+    def read(self, slot, seq, out=None):
+        """Copy a slot out if it still holds `seq`; None if it was overwritten."""
+        hdr = self.header[slot]
+        if hdr[0] != seq:
+            return None
+
+        shape = tuple(int(x) for x in hdr[1:])
+        nbytes = int(np.prod(shape))
+        if out is None or out.shape != shape:
+            out = np.empty(shape, dtype=np.uint8)
+        out.reshape(-1)[:] = self.data[slot, :nbytes]
+
+        if hdr[0] != seq:
+            return None
+        return out
+
+    def close(self, unlink=False):
+        self.header = None
+        self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# -------------------------------------------
+# Capture process (one per camera)
+# -------------------------------------------
+def capture_main(cam_id, url, ring_name, n_slots, max_shape, desc_queue, msg_queue, stop_event, stride):
+    os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp|rtsp_flags;prefer_tcp")
+    import cv2
+
+    ring = SharedFrameRing(ring_name, n_slots, max_shape)
+    captured = dropped = 0
+    warned = False
+
+    # Reopens with jittered backoff after a failed read
+    cap = ReconnectingCapture(url, max_failures=1, name=cam_id, stop_event=stop_event)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    if cap.isOpened():
+        print(f"[INFO] [{cam_id}] Stream opened")
+
+    try:
+        while not stop_event.is_set():
+            ret, img = cap.read()
+            if not ret:
+                continue
+
+            captured += 1
+            if captured % stride:
+                continue
+
+            # Stream larger than a ring slot (e.g. 4K with the 1080p default): downscale to fit
+            h, w = img.shape[:2]
+            if h > max_shape[0] or w > max_shape[1]:
+                scale = min(max_shape[0] / h, max_shape[1] / w)
+                if not warned:
+                    warned = True
+                    print(f"[WARNING] [{cam_id}] {w}x{h} frames exceed the ring slot "
+                          f"{max_shape[1]}x{max_shape[0]}, downscaling by {scale:.2f} (raise max_shape to avoid)")
+                img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+            slot, seq = ring.write(img)
+            try:
+                desc_queue.put_nowait((cam_id, slot, seq, time.time()))
+            except queue.Full:
+                dropped += 1   # inference is behind: this frame is skipped
+
+            if captured % 100 == 0:
+                msg_queue.put(("capture", cam_id, captured, dropped, cap.stats))
+    except Exception as e:
+        msg_queue.put(("error", cam_id, f"Capture process failed: {e!r}"))
+        raise
+    finally:
+        cap.release()
+        ring.close()
+
+
+# -------------------------------------------
+# Inference worker (models loaded once, serves every camera)
+# -------------------------------------------
+def load_detector(mode, recognize=False, threads=0, precision="fp32"):
+    """
+    recognize: also load the recognizer (only needed with a gallery)
+    threads:   ONNX Runtime intra-op threads per session in this worker (0 = auto)
+    precision: "fp32" or "int8" (quantize_models.py)
+    return: detect(img) -> (boxes (n, 4) int, embeddings (m, d) or None, valid (n,) bool or None)
+            embeddings only for the faces marked valid (alignable landmarks)
+    """
+    if mode == "insightface":
+        from recognition_engine import RecognitionEngine
+        from alignment import FaceAligner
+        modules = ("detection", "recognition") if recognize else ("detection",)
+        engine = RecognitionEngine(modules=modules, det_size=(320, 320),
+                                   det_threads=(threads, 1), rec_threads=(threads, 1), precision=precision)
+        aligner = FaceAligner()
+
+        def detect(img):
+            boxes, _, kps = engine.detect(img)
+            embs = valid = None
+            if engine.can_recognize and len(boxes) and kps is not None:
+                crops, valid = aligner.align(img, kps)
+                embs = engine.embed(crops[valid])   # degenerate landmarks: black crops, not embedded
+            return boxes.astype(np.int32).reshape(-1, 4), embs, valid
+
+        return detect
+
+    import cv2
+    import mediapipe as mp_lib
+    detector = mp_lib.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+
+    def detect(img):
+        h, w = img.shape[:2]
+        small = cv2.resize(img, (640, 360))
+        result = detector.process(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+        boxes = []
+        for det in result.detections or []:
+            b = det.location_data.relative_bounding_box
+            boxes.append((b.xmin * w, b.ymin * h, (b.xmin + b.width) * w, (b.ymin + b.height) * h))
+        return np.array(boxes, dtype=np.int32).reshape(-1, 4), None, None
+
+    return detect
+
+
+def worker_main(worker_id, rings, desc_queue, msg_queue, stop_event, mode, gallery_path, threshold,
+                threads, precision, ivf_min_size):
+    attached = {cam_id: SharedFrameRing(*spec) for cam_id, spec in rings.items()}
+    buffers = {}
+
+    try:
+        detect = load_detector(mode, recognize=bool(gallery_path), threads=threads, precision=precision)
+
+        gallery = None
+        if gallery_path:
+            from gallery_store import open_gallery
+            gallery = open_gallery(gallery_path, ivf_min_size=ivf_min_size)
+
+        print(f"[INFO] Worker {worker_id} ready ({mode})")
+
+        while not stop_event.is_set():
+            try:
+                cam_id, slot, seq, stamp = desc_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            img = attached[cam_id].read(slot, seq, buffers.get(cam_id))
+            if img is None:
+                msg_queue.put(("stale", cam_id, worker_id))
+                continue
+            buffers[cam_id] = img
+
+            boxes, embs, valid = detect(img)
+            names = []
+            if gallery is not None and embs is not None:
+                names = ["Unknown"] * len(boxes)
+                for i, name in zip(np.flatnonzero(valid), gallery.match_many(embs, threshold)):
+                    names[i] = name
+
+            msg_queue.put(("result", cam_id, worker_id, boxes.tolist(), names, time.time() - stamp))
+    except Exception as e:
+        msg_queue.put(("error", None, f"Worker {worker_id} failed: {e!r}"))
+        raise
+    finally:
+        for ring in attached.values():
+            ring.close()
+
+
+# -------------------------------------------
+# Supervisor
+# -------------------------------------------
+class Supervisor:
+    def __init__(self, cameras, workers=2, mode="insightface", stride=2,
+                 max_shape=(1080, 1920, 3), n_slots=4, gallery_path=None, threshold=0.4, threads=None,
+                 precision="fp32", ivf_min_size=50000):
+        """
+        cameras:   list of (cam_id, rtsp_url)
+        max_shape: largest frame a ring slot can hold; shared memory used is
+                   about cameras x n_slots x prod(max_shape) bytes (/dev/shm)
+        threads:   ONNX Runtime intra-op threads per worker (default: cores / workers)
+        precision: "fp32" or "int8" models (insightface mode)
+        """
+        self.cameras = cameras
+        self.n_workers = workers
+        self.mode = mode
+        self.stride = stride
+        self.max_shape = max_shape
+        self.n_slots = n_slots
+        self.gallery_path = gallery_path
+        self.ivf_min_size = ivf_min_size
+        self.threshold = threshold
+        self.threads = threads if threads is not None else max(1, (os.cpu_count() or 1) // workers)
+        self.precision = precision
+
+        self.ctx = mp.get_context("spawn")
+        self.stop_event = self.ctx.Event()
+        self.desc_queue = self.ctx.Queue(maxsize=2 * workers)
+        self.msg_queue = self.ctx.Queue()
+
+        self.rings = {}
+        self.specs = {}
+        self.captures = {}
+        self.workers = {}
+        self.restarts = {}   # process name -> {"failures", "retry_at", "started"}
+        self.stats = {cam_id: {"captured": 0, "dropped": 0, "processed": 0, "stale": 0, "latency": 0.0,
+                               "reconnects": 0, "ttff": None}
+                      for cam_id, _ in cameras}
+
+    def _start_capture(self, cam_id, url):
+        ring = self.rings[cam_id]
+        proc = self.ctx.Process(
+            target=capture_main, name=f"capture-{cam_id}", daemon=True,
+            args=(cam_id, url, ring.name, self.n_slots, self.max_shape,
+                  self.desc_queue, self.msg_queue, self.stop_event, self.stride),
+        )
+        proc.start()
+        self.captures[cam_id] = (proc, url)
+        self._started(proc)
+
+    def _start_worker(self, worker_id):
+        proc = self.ctx.Process(
+            target=worker_main, name=f"worker-{worker_id}", daemon=True,
+            args=(worker_id, self.specs, self.desc_queue, self.msg_queue, self.stop_event,
+                  self.mode, self.gallery_path, self.threshold, self.threads, self.precision,
+                  self.ivf_min_size),
+        )
+        proc.start()
+        self.workers[worker_id] = proc
+        self._started(proc)
+
+    def _started(self, proc):
+        state = self.restarts.setdefault(proc.name, {"failures": 0, "retry_at": None})
+        state["started"] = time.time()
+
+    def _revive(self, proc, restart):
+        """
+        Restart a dead process. Crash loops (dying within a minute of starting)
+        back off 1, 2, 4 ... 60 s instead of respawning every second.
+        """
+        if proc.is_alive():
+            return
+        state = self.restarts[proc.name]
+        now = time.time()
+        if state["retry_at"] is None:
+            quick = now - state["started"] < RESTART_BACKOFF[1]
+            state["failures"] = state["failures"] + 1 if quick else 1
+            delay = min(RESTART_BACKOFF[0] * 2 ** (state["failures"] - 1), RESTART_BACKOFF[1])
+            state["retry_at"] = now + delay
+            print(f"[WARNING] {proc.name} exited ({proc.exitcode}), restarting in {delay:.0f}s")
+        if now >= state["retry_at"]:
+            state["retry_at"] = None
+            restart()
+
+    def start(self):
+        for cam_id, url in self.cameras:
+            self.rings[cam_id] = SharedFrameRing(None, self.n_slots, self.max_shape, create=True)
+            self._start_capture(cam_id, url)
+
+        self.specs = {cam_id: (ring.name, self.n_slots, self.max_shape) for cam_id, ring in self.rings.items()}
+        for worker_id in range(self.n_workers):
+            self._start_worker(worker_id)
+
+        print(f"[INFO] Supervisor started: {len(self.cameras)} cameras, {self.n_workers} workers x {self.threads} threads")
+
+    def _handle(self, msg):
+        kind, cam_id = msg[0], msg[1]
+        if kind == "error":
+            print(f"[ERROR] [{cam_id}] {msg[2]}" if cam_id else f"[ERROR] {msg[2]}")
+            return
+        s = self.stats[cam_id]
+        if kind == "capture":
+            s["captured"], s["dropped"] = msg[2], msg[3]
+            s["reconnects"], s["ttff"] = msg[4]["reconnects"], msg[4]["ttff_last"]
+        elif kind == "stale":
+            s["stale"] += 1
+        elif kind == "result":
+            startup.mark_ready(f"first frame processed ({cam_id})")
+            s["processed"] += 1
+            s["latency"] = 0.9 * s["latency"] + 0.1 * msg[5]
+            if msg[4]:
+                print(f"[INFO] [{cam_id}] {msg[4]}")
+
+    def run(self, report_every=10.0):
+        self.start()
+        last_report = time.time()
+        try:
+            while True:
+                try:
+                    self._handle(self.msg_queue.get(timeout=1.0))
+                except queue.Empty:
+                    pass
+
+                # Restart crashed capture / worker processes
+                for cam_id, (proc, url) in list(self.captures.items()):
+                    self._revive(proc, lambda: self._start_capture(cam_id, url))
+                for worker_id, proc in list(self.workers.items()):
+                    self._revive(proc, lambda: self._start_worker(worker_id))
+
+                if time.time() - last_report >= report_every:
+                    last_report = time.time()
+                    for cam_id, s in self.stats.items():
+                        print(f"[INFO] [{cam_id}] captured={s['captured']} processed={s['processed']} "
+                              f"dropped={s['dropped']} stale={s['stale']} latency={s['latency'] * 1000:.0f}ms"
+                              f" reconnects={s['reconnects']}"
+                              + (f" ttff={s['ttff']:.2f}s" if s["ttff"] is not None else ""))
+        except KeyboardInterrupt:
+            print("\n[INFO] Received interrupt signal, shutting down...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for proc in [p for p, _ in self.captures.values()] + list(self.workers.values()):
+            proc.join(timeout=3.0)
+            if proc.is_alive():
+                proc.terminate()
+        for ring in self.rings.values():
+            ring.close(unlink=True)
@@ -2,53 +2,22 @@
 
 import cv2
 import argparse
-import numpy as np
 import mediapipe as mp
 
-from rtsp_client import RTSPClient
+from rtsp_session import ReconnectingSession
 from decoder import H264Decoder
 from h264_rtp_parser import H264RTPParser
+from alignment import align_face
+from landmarks import LandmarkBuffer, five_points
+from pipeline import Pipeline
 
 
 # 1) Ininitalize Mediapipe
 mp_face = mp.solutions.face_detection
 mp_mesh = mp.solutions.face_mesh
 
-# 5 Landmark Index for Mediapipe FaceMesh
-FACEMESH_LANDMARK_IDXS = {
-    "left_eye": 33,
-    "right_eye": 263,
-    "nose": 1,
-    "mouth_left": 61,
-    "mouth_right": 291,
-}
-
-
-# 2) Arcface alighment Function
-def align_face(img, landmarks_5):
-    """
-    img: BGR frame
-    landmarks_5: (5,2) array
-    return: 112 x 112 aligned face
-    """
-
-    # ArcFace Reference 5 Points
-    src = np.array([
-        [38.2946, 51.6963],
-        [73.5318, 51.5014],
-        [56.0252, 71.7366],
-        [41.5493, 92.3655],
-        [70.7299, 92.2041],
-    ], dtype=np.float32)
-
-    dst = landmarks_5.astype(np.float32)
-    M = cv2.estimateAffinePartial2D(dst, src)[0]
-    aligned = cv2.warpAffine(img, M, (112, 112), borderValue=0.0)
-
-    return aligned
-
-
-# 3) Main Streaming Loop
+
+# 2) Main Streaming Pipeline
 def main():
     # --- CLI arguments ---
     parser = argparse.ArgumentParser(description="Hanwha Camera Face Recognition Pipeline (Mediapipe)")
@@ -58,6 +27,8 @@ def main():
     parser.add_argument("--stride", type=int, default=2, help="Do detection every N frames")
     parser.add_argument("--display_width", type=int, default=1280)
     parser.add_argument("--display_height", type=int, default=720)
+    parser.add_argument("--transport", choices=["udp", "tcp"], default="udp",
+                        help="RTP over UDP (ephemeral ports) or interleaved on the RTSP TCP connection")
     args = parser.parse_args()
 
     camera_ip = args.ip
@@ -81,130 +52,148 @@ def main():
     )
     print("[Info] Mediapipe Face Mesh initialized.")
 
+    # 478 refined FaceMesh points, copied without per-point lists
+    landmark_buf = LandmarkBuffer(max_faces=1, n_points=478)
+
     # Construct RTSP URL using Hanwha official format 
     rtsp_url = f"rtsp://{username}:{password}@{camera_ip}/profile2/media.smp"
     print(f"[INFO] Connecting to: {rtsp_url}")
 
-    # Initialize RTSP client + decoder
-    client = RTSPClient(rtsp_url)
-    client.connect()
-    client.options()
-    client.describe()
-    client.setup()
-    client.play()
-    client.open_rtp_socket()
-
+    # Initialize RTSP session + decoder
     parser_rtp = H264RTPParser()
-    decoder = H264Decoder()
-
-    frame_count = 0
-    last_faces = []
-
-    print("[INFO] Starting stream... Press ESC to exit")
-
-    # Main loop
-
-    while True:
-        packet = client.receive_rtp_packet()
-        if not packet:
-            continue
-
-        # For debugging:
-        # print(f"[RTP] received: {len(packet)} bytes")
-
-        nal = parser_rtp.feed(packet)
-        if nal is None:
-            continue
+    decoder = H264Decoder(threads=0, behind_realtime=True)
 
-        frames = decoder.decode(nal)
+    def reset_stream():
+        # New session: RTP sequence numbers and timestamps start over
+        nonlocal parser_rtp, decoder
+        parser_rtp = H264RTPParser()
+        decoder = H264Decoder(threads=0, behind_realtime=True)
 
-        for frame in frames:
-            img = frame.to_ndarray(format="bgr24")
-            h, w = img.shape[:2]
+    pipeline = Pipeline()
+    session = ReconnectingSession(rtsp_url, transport=args.transport, batch_size=64,
+                                  on_reconnect=reset_stream, stop_event=pipeline.stop_event)
 
-            # 1) Downscale for detection
-            small_w, small_h = 640, 360
-            small = cv2.resize(img, (small_w, small_h))
+    # Capture stage: drains every queued RTP datagram per wakeup (zero-copy memoryviews),
+    # reconnects with cached SETUP/PLAY when the stream drops
+    def capture_frames():
+        for packet in session.packets():
+            # For debugging:
+            # print(f"[RTP] received: {len(packet)} bytes")
 
-            # 2) Detection every N frames
-            if frame_count % stride == 0:
-                rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-                det_result = detector.process(rgb_small)
+            # One decode call per complete picture (access unit)
+            frames = []
+            for au in parser_rtp.feed(packet):
+                frames.extend(decoder.decode_access_unit(au))
 
-                faces = []
-                if det_result.detections:
-                    for det in det_result.detections:
-                        bbox = det.location_data.relative_bounding_box
+            if frames:
+                session.mark_frame()
 
-                        xs = int(bbox.xmin * small_w)
-                        ys = int(bbox.ymin * small_h)
-                        xe = int((bbox.xmin + bbox.width) * small_w)
-                        ye = int((bbox.ymin + bbox.height) * small_h)
+            for frame in frames:
+                yield frame.to_ndarray(format="bgr24")
 
-                        # Scale back to original frame size
-                        X1 = int(xs * (w / small_w))
-                        Y1 = int(ys * (h / small_h))
-                        X2 = int(xe * (w / small_w))
-                        Y2 = int(ye * (h / small_h))
-
-                        faces.append((X1, Y1, X2, Y2))
-
-                last_faces = faces
-            else:
-                faces = last_faces
-            
-            frame_count += 1
-
-
-            # 3) FaceMesh Landmark + Alignment
-            aligned_preview = None
-
-            if len(faces) > 0:
-                x1, y1, x2, y2 = faces[0]
-
-                # Crop face for FaceMesh
-                face_roi = img[y1:y2, x1:x2]
-                if face_roi.size != 0:
-                    face_rgb = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
-                    mesh_result = mesh.process(face_rgb)
-
-                    if mesh_result.multi_face_landmarks:
-                        lm = mesh_result.multi_face_landmarks[0].landmark
+    frame_count = 0
+    last_faces = []
 
-                        # Compute Landmark (x,y) in full image coordinates
-                        landmarks_5 = []
-                        idxs = FACEMESH_LANDMARK_IDXS
+    # Detect stage: 640x360 detection every N frames, boxes carried in between
+    def detect(img):
+        nonlocal frame_count, last_faces
+        h, w = img.shape[:2]
+
+        # 1) Downscale for detection
+        small_w, small_h = 640, 360
+        small = cv2.resize(img, (small_w, small_h))
+
+        # 2) Detection every N frames
+        if frame_count % stride == 0:
+            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            det_result = detector.process(rgb_small)
+
+            faces = []
+            if det_result.detections:
+                for det in det_result.detections:
+                    bbox = det.location_data.relative_bounding_box
+
+                    xs = int(bbox.xmin * small_w)
+                    ys = int(bbox.ymin * small_h)
+                    xe = int((bbox.xmin + bbox.width) * small_w)
+                    ye = int((bbox.ymin + bbox.height) * small_h)
+
+                    # Scale back to original frame size
+                    X1 = int(xs * (w / small_w))
+                    Y1 = int(ys * (h / small_h))
+                    X2 = int(xe * (w / small_w))
+                    Y2 = int(ye * (h / small_h))
+
+                    faces.append((X1, Y1, X2, Y2))
+
+            last_faces = faces
+        else:
+            faces = last_faces
+
+        frame_count += 1
+        return img, faces
+
+    # Landmark stage: FaceMesh Landmark + Alignment on the first face
+    def landmark(item):
+        img, faces = item
+        landmarks_5 = aligned_preview = None
+
+        if len(faces) > 0:
+            x1, y1, x2, y2 = faces[0]
+
+            # Crop face for FaceMesh
+            face_roi = img[y1:y2, x1:x2]
+            if face_roi.size != 0:
+                face_rgb = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
+                mesh_result = mesh.process(face_rgb)
+
+                if mesh_result.multi_face_landmarks:
+                    # Landmark (x,y) in full image coordinates
+                    pts = landmark_buf.fill([f.landmark for f in mesh_result.multi_face_landmarks])
+                    landmarks_5 = five_points(pts, x2 - x1, y2 - y1, origin=(x1, y1))[0]
+
+                    # Align face
+                    aligned_preview = align_face(img, landmarks_5)
+        return img, faces, landmarks_5, aligned_preview
+
+    # capture -> detect -> landmark run in worker threads, drawing/display here
+    pipeline.add_source("capture", capture_frames(), maxsize=1, policy="latest")
+    pipeline.add_stage("detect", detect, maxsize=2, policy="block")
+    pipeline.add_stage("landmark", landmark, maxsize=2, policy="latest")
+    pipeline.start()
 
-                        for key in ["left_eye", "right_eye", "nose", "mouth_left", "mouth_right"]:
-                            i = idxs[key]
-                            lx = lm[i].x * (x2 - x1) + x1
-                            ly = lm[i].y * (y2 - y1) + y1
-                            landmarks_5.append([lx, ly])
-                        
-                        landmarks_5 = np.array(landmarks_5, dtype=np.float32)
+    print("[INFO] Starting stream... Press ESC to exit")
 
-                        # Align face
-                        aligned_preview = align_face(img, landmarks_5)
+    try:
+        for result in pipeline.results():
+            if result is None:
+                cv2.waitKey(1)
+                continue
 
-                        # Draw 5 landmarks on screen
-                        for (lx, ly) in landmarks_5:
-                            cv2.circle(img, (int(lx), int(ly)), 3, (0, 255, 255), -1)
+            img, faces, landmarks_5, aligned_preview = result
 
+            # 3) Draw 5 landmarks on screen
+            if landmarks_5 is not None:
+                for (lx, ly) in landmarks_5:
+                    cv2.circle(img, (int(lx), int(ly)), 3, (0, 255, 255), -1)
 
             # 4) Face Detection - Draw boxes scaled to original image
             for (x1, y1, x2, y2) in faces:
                 cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
-
             # 5) Resize for display
             display_img = cv2.resize(img, (args.display_width, args.display_height))
             cv2.imshow("Face Detection - Hanwha Camera - Mediapipe", display_img)
 
             if aligned_preview is not None:
                 cv2.imshow("Aligned Face (112x112)", aligned_preview)
-            
+
             if cv2.waitKey(1) == 27:  # ESC
-                return
+                break
+    finally:
+        pipeline.stop()
+        session.close()
+        cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
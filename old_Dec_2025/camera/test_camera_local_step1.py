@@ -2,40 +2,17 @@
 
 import cv2
 import argparse
-import numpy as np
 
-from rtsp_client import RTSPClient
+from rtsp_session import ReconnectingSession
 from decoder import H264Decoder
 from h264_rtp_parser import H264RTPParser
+from alignment import align_face
+from pipeline import Pipeline
 
 from insightface.app import FaceAnalysis
 
 
-# 1) Arcface 5-point alighment Function
-def align_face(img, landmarks_5):
-    """
-    img: BGR frame
-    landmarks_5: (5,2) array
-    return: 112 x 112 aligned face (ArcFace Style)
-    """
-
-    # ArcFace Reference 5 Points
-    src = np.array([
-        [38.2946, 51.6963],
-        [73.5318, 51.5014],
-        [56.0252, 71.7366],
-        [41.5493, 92.3655],
-        [70.7299, 92.2041],
-    ], dtype=np.float32)
-
-    dst = landmarks_5.astype(np.float32)
-    M = cv2.estimateAffinePartial2D(dst, src)[0]
-    aligned = cv2.warpAffine(img, M, (112, 112), borderValue=0.0)
-
-    return aligned
-
-
-# 2) Main Streaming Loop
+# 1) Main Streaming Pipeline
 def main():
     # --- CLI arguments ---
     parser = argparse.ArgumentParser(description="Hanwha Camera Face Recognition Pipeline (InsightFace)")
@@ -45,6 +22,8 @@ def main():
     parser.add_argument("--stride", type=int, default=2, help="Do detection every N frames")
     parser.add_argument("--display_width", type=int, default=1280)
     parser.add_argument("--display_height", type=int, default=720)
+    parser.add_argument("--transport", choices=["udp", "tcp"], default="udp",
+                        help="RTP over UDP (ephemeral ports) or interleaved on the RTSP TCP connection")
     args = parser.parse_args()
 
     camera_ip = args.ip
@@ -61,49 +40,81 @@ def main():
     rtsp_url = f"rtsp://{username}:{password}@{camera_ip}/profile2/media.smp"
     print(f"[INFO] Connecting to: {rtsp_url}")
 
-    # Initialize RTSP client + decoder
-    client = RTSPClient(rtsp_url)
-    client.connect()
-    client.options()
-    client.describe()
-    client.setup()
-    client.play()
-    client.open_rtp_socket()
-
+    # Initialize RTSP session + decoder
     parser_rtp = H264RTPParser()
-    decoder = H264Decoder()
+    decoder = H264Decoder(threads=0, behind_realtime=True)
+
+    def reset_stream():
+        # New session: RTP sequence numbers and timestamps start over
+        nonlocal parser_rtp, decoder
+        parser_rtp = H264RTPParser()
+        decoder = H264Decoder(threads=0, behind_realtime=True)
+
+    pipeline = Pipeline()
+    session = ReconnectingSession(rtsp_url, transport=args.transport, batch_size=64,
+                                  on_reconnect=reset_stream, stop_event=pipeline.stop_event)
+
+    # Capture stage: drains every queued RTP datagram per wakeup (zero-copy memoryviews),
+    # reconnects with cached SETUP/PLAY when the stream drops
+    def capture_frames():
+        for packet in session.packets():
+            # For debugging:
+            # print(f"[RTP] received: {len(packet)} bytes")
+
+            # One decode call per complete picture (access unit)
+            frames = []
+            for au in parser_rtp.feed(packet):
+                frames.extend(decoder.decode_access_unit(au))
+
+            if frames:
+                session.mark_frame()
+
+            for frame in frames:
+                yield frame.to_ndarray(format="bgr24")
 
     frame_count = 0
     last_faces = []
 
-    print("[INFO] Starting stream... Press ESC to exit")
+    # Detect stage: InsightFace Detection every N frames, faces carried in between
+    def detect(img):
+        nonlocal frame_count, last_faces
+        if frame_count % stride == 0:
+            last_faces = app.get(img)
+        frame_count += 1
+        return img, last_faces
 
+    # Align stage: 5 Landmark (ArcFace standard) + Alignment of the first face
+    def align(item):
+        img, faces = item
+        aligned_face = None
 
-    # Main Streaming loop
+        for f in faces:
+            lm5 = f.landmark_2d_5 # shape (5,2)
+            if lm5 is None or len(lm5) != 5:
+                continue
 
-    while True:
-        packet = client.receive_rtp_packet()
-        if not packet:
-            continue
+            aligned_face = align_face(img, lm5)
 
-        # For debugging:
-        # print(f"[RTP] received: {len(packet)} bytes")
+            # Embedding would be next step
 
-        nal = parser_rtp.feed(packet)
-        if nal is None:
-            continue
+            break # Handle the first face for now
+        return img, faces, aligned_face
 
-        frames = decoder.decode(nal)
+    # capture -> detect -> align run in worker threads, drawing/display here
+    pipeline.add_source("capture", capture_frames(), maxsize=1, policy="latest")
+    pipeline.add_stage("detect", detect, maxsize=2, policy="block")
+    pipeline.add_stage("align", align, maxsize=2, policy="latest")
+    pipeline.start()
 
-        for frame in frames:
-            img = frame.to_ndarray(format="bgr24")
-            h, w = img.shape[:2]
+    print("[INFO] Starting stream... Press ESC to exit")
 
-            # InsightFace Detection
-            if frame_count % 3 == 0:
-                faces = app.get(img)
+    try:
+        for result in pipeline.results():
+            if result is None:
+                cv2.waitKey(1)
+                continue
 
-            aligned_face = None
+            img, faces, aligned_face = result
 
             for f in faces:
                 # 1) Bounding box
@@ -120,23 +131,21 @@ def main():
                 for (lx, ly) in lm5:
                     cv2.circle(img, (int(lx), int(ly)), 2, (0, 255, 255), -1)
 
-                # 3) Alignment (ArcFace standard)
-                aligned_face = align_face(img, lm5)
-
-                # Embedding would be next step
-
                 break # Handle the first face for now
 
-
-            # 4) Resize for display
+            # 3) Resize for display
             display_img = cv2.resize(img, (args.display_width, args.display_height))
             cv2.imshow("InsightFace Detection + Landmark + Alighment", display_img)
 
             if aligned_face is not None:
                 cv2.imshow("Aligned Face (112x112)", aligned_face)
-            
+
             if cv2.waitKey(1) == 27:  # ESC
-                return
+                break
+    finally:
+        pipeline.stop()
+        session.close()
+        cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,10 @@
 # camera/test_opencv_insightface.py
 
+import startup
+
 import os
 import sys
+import time
 
 # ⭐ RTSP TCP transport 설정 (가장 먼저!)
 os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = 'rtsp_transport;tcp|rtsp_flags;prefer_tcp'
@@ -9,49 +12,116 @@ os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = 'rtsp_transport;tcp|rtsp_flags;pre
 import cv2
 import argparse
 import numpy as np
-from insightface.app import FaceAnalysis
+from concurrent.futures import ThreadPoolExecutor
 
+from gallery_store import open_gallery
+from pipeline import Pipeline
+from detection_scheduler import AdaptiveScheduler
+from motion_gate import MotionGate
+from tracker import FaceTracker
+from roi_detection import ROIDetector
+from track_cache import TrackEmbeddingCache, face_quality
+from rtsp_session import ReconnectingCapture
+from frame_source import open_source
+from alignment import FaceAligner, align_face
 
-def align_face(img, landmarks_5):
-    """ArcFace 스타일 얼굴 정렬 (112x112)"""
-    src = np.array([
-        [38.2946, 51.6963],
-        [73.5318, 51.5014],
-        [56.0252, 71.7366],
-        [41.5493, 92.3655],
-        [70.7299, 92.2041],
-    ], dtype=np.float32)
 
-    dst = landmarks_5.astype(np.float32)
-    M = cv2.estimateAffinePartial2D(dst, src)[0]
-    
-    if M is None:
-        return None
-        
-    aligned = cv2.warpAffine(img, M, (112, 112), borderValue=0.0)
-    return aligned
+def capture_frames(cap, rtsp_url, max_retries=100):
+    """Capture stage: yield BGR frames from the stream (runs in its own thread)."""
+    retry_count = 0
+    first_frame_grabbed = False
+
+    while True:
+        ret, img = cap.read()
 
+        if not ret:
+            retry_count += 1
 
-def main():
+            # 첫 프레임을 못 받는 경우
+            if not first_frame_grabbed and retry_count > max_retries:
+                print(f"[ERROR] Failed to grab first frame after {max_retries} retries")
+                print("[ERROR] This usually means:")
+                print("  1. Stream format not supported")
+                print("  2. Network timeout (check port forwarding)")
+                print("  3. Camera requires different RTSP parameters")
+                print()
+                print("[DEBUG] Try this command on your local machine:")
+                print(f"  ffplay -rtsp_transport tcp '{rtsp_url}'")
+                return
+
+            # 주기적으로 상태 출력
+            if retry_count % 10 == 0:
+                print(f"[WARNING] Waiting for frame... ({retry_count}/{max_retries})")
+
+            continue
+
+        # ✅ 첫 프레임 성공!
+        if not first_frame_grabbed:
+            h, w = img.shape[:2]
+            print(f"[INFO] ✅✅✅ First frame grabbed successfully! Resolution: {w}x{h}")
+            print(f"[INFO] Took {retry_count} attempts")
+            first_frame_grabbed = True
+            retry_count = 0
+
+        yield img
+
+
+def load_engine(args, modules):
+    """onnxruntime import + sessions + warmup inference (runs while the stream opens)."""
+    from recognition_engine import RecognitionEngine
+
+    engine = RecognitionEngine(pack=args.pack, modules=modules, det_size=(320, 320),
+                               det_threads=(args.det_threads, 1), rec_threads=(args.rec_threads, 1),
+                               precision=args.precision)
+    engine.warmup(det_sizes=() if args.no_roi else ((args.roi_size, args.roi_size),))
+    return engine
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Face Recognition - OpenCV + InsightFace")
-    parser.add_argument("--ip", required=True, help="Camera IP (can include port: IP:PORT)")
+    parser.add_argument("--ip", default=None, help="Camera IP (can include port: IP:PORT)")
     parser.add_argument("--user", default="admin", help="Username")
     parser.add_argument("--password", default="Sunap1!!", help="Password")
-    parser.add_argument("--stride", type=int, default=3, help="Detection every N frames")
+    parser.add_argument("--stride", type=int, default=3, help="Initial detection interval (frames), adapted at runtime")
+    parser.add_argument("--budget", type=float, default=200, help="Latency budget in ms (queue lag + detector)")
+    parser.add_argument("--motion_sensitivity", type=float, default=0.5,
+                        help="Motion gate sensitivity 0..1 (negative = detect without gating)")
+    parser.add_argument("--refresh", type=float, default=2.0, help="Forced full-frame detection every N seconds")
     parser.add_argument("--display_width", type=int, default=1280)
     parser.add_argument("--display_height", type=int, default=720)
     parser.add_argument("--headless", action="store_true", help="Run without display")
-    args = parser.parse_args()
+    parser.add_argument("--gallery", default=None, help="Gallery file for recognition (optional)")
+    parser.add_argument("--ivf_min_size", type=int, default=50000,
+                        help="Approximate (IVF) gallery search from this many identities (0 = always exact)")
+    parser.add_argument("--threshold", type=float, default=0.4, help="Cosine similarity threshold")
+    parser.add_argument("--reverify", type=int, default=30, help="Re-run recognition on a track every N frames")
+    parser.add_argument("--no_roi", action="store_true",
+                        help="Detect only at det_size (no full-resolution crops around tracked faces)")
+    parser.add_argument("--roi_pad", type=float, default=0.6, help="ROI margin around a tracked face, in face sizes")
+    parser.add_argument("--roi_size", type=int, default=160, help="Detector input size for ROI crops (multiple of 32)")
+    parser.add_argument("--pack", default="buffalo_l", help="InsightFace model pack (buffalo_l, buffalo_s, ...)")
+    parser.add_argument("--det_threads", type=int, default=0, help="ONNX Runtime intra-op threads for detection (0 = auto)")
+    parser.add_argument("--rec_threads", type=int, default=0, help="ONNX Runtime intra-op threads for recognition (0 = auto)")
+    parser.add_argument("--precision", choices=["fp32", "int8"], default="fp32",
+                        help="int8 = quantized models from quantize_models.py")
+    parser.add_argument("--source", default=None,
+                        help="Recorded input instead of the camera: .pcap (RTP), .h264 (Annex-B) or a video file")
+    parser.add_argument("--unpaced", action="store_true",
+                        help="Replay --source as fast as possible, every frame processed (default: real time)")
+    parser.add_argument("--loop", action="store_true", help="Restart --source at the end")
+    args = parser.parse_args(argv)
+    if not args.ip and not args.source:
+        parser.error("--ip or --source is required")
 
-    # InsightFace 초기화
-    print("[INFO] Initializing InsightFace...")
-    app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"])
-    app.prepare(ctx_id=0, det_size=(320, 320))
-    print("[INFO] InsightFace (buffalo_l) loaded")
+    gallery = open_gallery(args.gallery, ivf_min_size=args.ivf_min_size) if args.gallery else None
+    if gallery is not None:
+        print(f"[INFO] Gallery loaded: {len(gallery)} identities")
 
     # IP:PORT 형식 처리
-    camera_ip = args.ip
-    if ':' in camera_ip:
+    camera_ip = args.ip or ""
+    if args.source:
+        rtsp_url = None
+    elif ':' in camera_ip:
         # IP와 포트 분리
         ip_parts = camera_ip.split(':')
         host = ip_parts[0]
@@ -61,18 +131,38 @@ def main():
         # 포트 없으면 기본 RTSP 포트(554) 사용
         rtsp_url = f"rtsp://{args.user}:{args.password}@{camera_ip}/profile2/media.smp"
     
-    print(f"[INFO] Connecting to: {rtsp_url}")
-    print("[INFO] Using TCP transport for RTSP")
+    # InsightFace 초기화: detection + recognition only (detection only without a gallery),
+    # loaded and warmed up in the background while the RTSP stream opens
+    print("[INFO] Initializing InsightFace...")
+    if args.source:
+        print(f"[INFO] Replaying: {args.source} ({'unpaced' if args.unpaced else 'real time'})")
+    else:
+        print(f"[INFO] Connecting to: {rtsp_url}")
+        print("[INFO] Using TCP transport for RTSP")
+    modules = ("detection", "recognition") if gallery is not None else ("detection",)
+    cap = source = None
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        loading = pool.submit(load_engine, args, modules)
+
+        if args.source:
+            # Offline replay: pcap / Annex-B / video file, no camera needed
+            source = open_source(args.source, paced=not args.unpaced, loop=args.loop)
+        else:
+            # OpenCV VideoCapture with FFmpeg backend (reopened with backoff when the stream drops)
+            # TCP transport는 이미 환경변수로 설정됨
+            cap = ReconnectingCapture(rtsp_url)
+            startup.log_step("RTSP open finished")
+
+            # 타임아웃 및 버퍼 설정
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        engine = loading.result()
+    startup.log_step(f"InsightFace loaded: {engine.describe()}")
+    if gallery is not None and isinstance(engine.encoder.dim, int):
+        gallery.check_dim(engine.encoder.dim)   # gallery enrolled with another model: fail at startup
 
-    # OpenCV VideoCapture with FFmpeg backend
-    # TCP transport는 이미 환경변수로 설정됨
-    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
-    
-    # 타임아웃 및 버퍼 설정
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-    
     # 연결 확인
-    if not cap.isOpened():
+    if cap is not None and not cap.isOpened():
         print("[ERROR] Failed to open RTSP stream")
         print("[ERROR] Possible causes:")
         print("  - Wrong credentials")
@@ -84,99 +174,170 @@ def main():
     print("[INFO] Attempting to grab first frame...")
 
     frame_count = 0
-    last_faces = []
     face_detected_count = 0
-    retry_count = 0
-    max_retries = 100  # 100번 재시도
-    first_frame_grabbed = False
 
-    while True:
-        ret, img = cap.read()
-        
-        if not ret:
-            retry_count += 1
-            
-            # 첫 프레임을 못 받는 경우
-            if not first_frame_grabbed and retry_count > max_retries:
-                print(f"[ERROR] Failed to grab first frame after {max_retries} retries")
-                print("[ERROR] This usually means:")
-                print("  1. Stream format not supported")
-                print("  2. Network timeout (check port forwarding)")
-                print("  3. Camera requires different RTSP parameters")
-                print()
-                print("[DEBUG] Try this command on your local machine:")
-                print(f"  ffplay -rtsp_transport tcp '{rtsp_url}'")
-                break
-            
-            # 주기적으로 상태 출력
-            if retry_count % 10 == 0:
-                print(f"[WARNING] Waiting for frame... ({retry_count}/{max_retries})")
-            
-            continue
-        
-        # ✅ 첫 프레임 성공!
-        if not first_frame_grabbed:
-            h, w = img.shape[:2]
-            print(f"[INFO] ✅✅✅ First frame grabbed successfully! Resolution: {w}x{h}")
-            print(f"[INFO] Took {retry_count} attempts")
-            first_frame_grabbed = True
-            retry_count = 0
+    # Stable track IDs: recognition runs once per track (+ re-verify), labels carry forward
+    tracker = FaceTracker(reverify_every=args.reverify)
+
+    # Preallocated (N, 112, 112, 3) batch for the recognizer
+    aligner = FaceAligner(max_faces=16)
+
+    # Quality-weighted template per track; the gallery is queried with it only when it moved
+    emb_dim = engine.encoder.dim if engine.can_recognize and isinstance(engine.encoder.dim, int) else 512
+    track_cache = TrackEmbeddingCache(dim=emb_dim, capacity=256, ttl=10.0)
+
+    # Every frame: SCRFD on full-resolution crops around the tracked faces, so
+    # small / distant faces are not lost in the 320x320 full-frame pass, which
+    # then only has to catch new faces
+    roi_detector = None
+    if not args.no_roi:
+        roi_detector = ROIDetector(lambda crop: engine.detect(crop, input_size=(args.roi_size, args.roi_size)),
+                                   pad=args.roi_pad)
 
-        # InsightFace detection
-        if frame_count % args.stride == 0:
-            faces = app.get(img)
-            last_faces = faces
-            if len(faces) > 0:
+    # Detection interval follows detector latency, queue lag and face motion
+    scheduler = AdaptiveScheduler(interval=args.stride, budget=args.budget / 1000.0)
+
+    # Skip detection on frames where nothing moved (full frame every --refresh s)
+    gate = None
+    if args.motion_sensitivity >= 0:
+        gate = MotionGate(sensitivity=args.motion_sensitivity, refresh=args.refresh)
+
+    # Detect stage (SCRFD only, on the frames the scheduler picks) + tracking
+    def detect(item):
+        nonlocal frame_count, face_detected_count
+        captured_at, img = item
+        kpss = None
+        sweep = None
+        if scheduler.should_detect(lag=time.monotonic() - captured_at):
+            if gate is None or gate.update(img):
+                start = time.perf_counter()
+                sweep = engine.detect(img)
+                scheduler.record(time.perf_counter() - start, sweep[0])
+            else:
+                scheduler.skip(len(tracker.tracks))   # nothing moved: static / idle scene
+
+        if roi_detector is not None and (sweep is not None or tracker.tracks):
+            sweep = roi_detector.detect(img, tracker.predicted_boxes(), sweep)
+
+        if sweep is not None:
+            boxes, scores, kpss = sweep
+            tracks = tracker.update(boxes, scores)
+            if len(boxes) > 0:
                 face_detected_count += 1
         else:
-            faces = last_faces
+            tracks = tracker.predict()
+
+        # New tracks / changed confidence / re-verify interval: (track, kps, quality) to embed
+        todo = []
+        if engine.can_recognize and kpss is not None:
+            for t in tracker.pending(tracks):
+                todo.append((t, kpss[t.det_index], face_quality(t.score, t.bbox)))
 
         frame_count += 1
+        boxes = [(t, t.bbox.copy(), kpss[t.det_index] if kpss is not None and t.det_index >= 0 else None)
+                 for t in tracks]
+        return img, boxes, todo
 
-        aligned_face = None
+    # Recognize stage: 필요한 track만 배치 임베딩 -> track template 갱신 -> template으로 한 번에 검색
+    def recognize(item):
+        img, boxes, todo = item
+        if todo:
+            # All crops aligned into one batch -> one recognizer call
+            crops, valid = aligner.align(img, np.stack([kps for _, kps, _ in todo]))
+            feats = engine.embed(crops)
+            for (t, _, quality), emb, ok in zip(todo, feats, valid):
+                if ok:
+                    track_cache.add(t.id, emb, quality)
+        track_cache.evict_expired()
 
-        for f in faces:
-            # Bounding box
-            x1, y1, x2, y2 = map(int, f.bbox)
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        if todo and gallery is not None:
+            results = track_cache.recognize(gallery, [t.id for t, _, _ in todo], args.threshold)
+            for t, _, _ in todo:
+                name, score = results.get(t.id) or (None, None)
+                tracker.set_label(t, name, score)
+        return img, boxes
 
-            # 5 Landmarks
-            lm5 = f.landmark_2d_5
-            if lm5 is not None and len(lm5) == 5:
-                for (lx, ly) in lm5:
-                    cv2.circle(img, (int(lx), int(ly)), 2, (0, 255, 255), -1)
+    # capture -> detect -> recognize run in worker threads, the sink (draw/display) here
+    pipeline = Pipeline()
+    if source is not None:
+        # Unpaced replay: block instead of dropping, so every recorded frame is processed
+        frames = ((time.monotonic(), img) for _, img in source)
+        pipeline.add_source("capture", frames, maxsize=1, policy="block" if args.unpaced else "latest")
+    else:
+        frames = ((time.monotonic(), img) for img in capture_frames(cap, rtsp_url))
+        pipeline.add_source("capture", frames, maxsize=1, policy="latest")
+    pipeline.add_stage("detect", detect, maxsize=2, policy="block")
+    pipeline.add_stage("recognize", recognize, maxsize=2, policy="latest")
+    pipeline.start()
 
-                # Alignment
-                aligned_face = align_face(img, lm5)
+    shown = 0
+    recognized = False
+    try:
+        for result in pipeline.results():
+            if result is None:
+                if not args.headless:
+                    cv2.waitKey(1)
+                continue
 
-            # Embedding (선택사항)
-            # embedding = f.embedding  # 512-dim vector
-            # print(f"[DEBUG] Embedding shape: {embedding.shape}")
+            img, boxes = result
+            shown += 1
+            if shown == 1:
+                startup.mark_ready("first frame processed")
+            if not recognized and any(t.label not in (None, "Unknown") for t, _, _ in boxes):
+                recognized = True
+                startup.log_step("first frame with a recognized track")
+            aligned_face = None
 
-            break  # 첫 번째 얼굴만
+            for t, bbox, lm5 in boxes:
+                # Bounding box + track ID, label carried forward from the last recognition
+                x1, y1, x2, y2 = map(int, bbox)
+                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                label = f"#{t.id}" if t.label is None else f"#{t.id} {t.label}"
+                cv2.putText(img, label, (x1, y1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
 
-        # 통계 출력
-        if frame_count % 100 == 0:
-            print(f"[INFO] Processed {frame_count} frames, {face_detected_count} faces detected")
+                # 5 Landmarks (frames with a fresh detection)
+                if lm5 is not None and len(lm5) == 5:
+                    for (lx, ly) in lm5:
+                        cv2.circle(img, (int(lx), int(ly)), 2, (0, 255, 255), -1)
 
-        # Display (headless 모드가 아닐 때만)
-        if not args.headless:
-            display_img = cv2.resize(img, (args.display_width, args.display_height))
-            cv2.imshow("InsightFace Detection", display_img)
+                    # Alignment
+                    aligned_face = align_face(img, lm5)
 
-            if aligned_face is not None:
-                cv2.imshow("Aligned Face (112x112)", aligned_face)
+            # 통계 출력
+            if shown % 100 == 0:
+                print(f"[INFO] Processed {frame_count} frames, {face_detected_count} faces detected")
+                print(f"[INFO] {pipeline.format_stats()}")
+                print(f"[INFO] Scheduler: {scheduler.format_stats()}")
+                print(f"[INFO] Tracker: {tracker.stats}")
+                print(f"[INFO] Track cache: {track_cache.stats}")
+                if gate is not None:
+                    print(f"[INFO] Motion gate: {gate.stats['pass_rate'] * 100:.0f}% of checked frames detected")
+                if roi_detector is not None:
+                    print(f"[INFO] ROI detection: {roi_detector.stats}")
 
-            key = cv2.waitKey(1)
-            if key == 27:  # ESC
-                print("[INFO] ESC pressed, exiting...")
-                break
+            # Display (headless 모드가 아닐 때만)
+            if not args.headless:
+                display_img = cv2.resize(img, (args.display_width, args.display_height))
+                cv2.imshow("InsightFace Detection", display_img)
+
+                if aligned_face is not None:
+                    cv2.imshow("Aligned Face (112x112)", aligned_face)
+
+                key = cv2.waitKey(1)
+                if key == 27:  # ESC
+                    print("[INFO] ESC pressed, exiting...")
+                    break
+    finally:
+        pipeline.stop()
+        if cap is not None:
+            cap.release()
+        if not args.headless:
+            cv2.destroyAllWindows()
 
-    cap.release()
-    if not args.headless:
-        cv2.destroyAllWindows()
-    
     print(f"[INFO] Total frames: {frame_count}, Faces detected: {face_detected_count}")
+    if source is not None:
+        print(f"[INFO] Source: {source.stats}")
 
 
 if __name__ == "__main__":
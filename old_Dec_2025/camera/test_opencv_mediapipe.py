@@ -1,81 +1,123 @@
 # camera/test_opencv_mediapipe.py
 
+import startup
+
+import time
 import cv2
 import argparse
 import numpy as np
-import mediapipe as mp
-
-# Mediapipe 초기화
-mp_face = mp.solutions.face_detection
-mp_mesh = mp.solutions.face_mesh
-
-# 5 Landmark Index
-FACEMESH_LANDMARK_IDXS = {
-    "left_eye": 33,
-    "right_eye": 263,
-    "nose": 1,
-    "mouth_left": 61,
-    "mouth_right": 291,
-}
-
-
-def align_face(img, landmarks_5):
-    """ArcFace 스타일 얼굴 정렬 (112x112)"""
-    src = np.array([
-        [38.2946, 51.6963],
-        [73.5318, 51.5014],
-        [56.0252, 71.7366],
-        [41.5493, 92.3655],
-        [70.7299, 92.2041],
-    ], dtype=np.float32)
-
-    dst = landmarks_5.astype(np.float32)
-    M = cv2.estimateAffinePartial2D(dst, src)[0]
-    
-    if M is None:
-        return None
-        
-    aligned = cv2.warpAffine(img, M, (112, 112), borderValue=0.0)
-    return aligned
-
-
-def main():
-    parser = argparse.ArgumentParser(description="Face Recognition - OpenCV + Mediapipe")
-    parser.add_argument("--ip", required=True, help="Camera IP")
-    parser.add_argument("--user", default="admin", help="Username")
-    parser.add_argument("--password", default="Sunap1!!", help="Password")
-    parser.add_argument("--stride", type=int, default=2, help="Detection every N frames")
-    parser.add_argument("--display_width", type=int, default=1280)
-    parser.add_argument("--display_height", type=int, default=720)
-    parser.add_argument("--headless", action="store_true", help="Run without display")
-    args = parser.parse_args()
+from concurrent.futures import ThreadPoolExecutor
+
+from rtsp_session import ReconnectingCapture
+from frame_source import open_source
+from alignment import align_face
+from detection_scheduler import AdaptiveScheduler
+from motion_gate import MotionGate
+from tracker import FaceTracker
+from roi_detection import ROIDetector
+from landmarks import LandmarkBuffer, five_points
+from pipeline import Pipeline
+
+
+def detect_boxes(detector, rgb):
+    """Mediapipe detections on an RGB image -> (boxes (n, 4) in pixels, scores (n,), None)"""
+    h, w = rgb.shape[:2]
+    det_result = detector.process(np.ascontiguousarray(rgb))
+
+    boxes, scores = [], []
+    for det in det_result.detections or []:
+        bbox = det.location_data.relative_bounding_box
+        boxes.append([bbox.xmin * w, bbox.ymin * h,
+                      (bbox.xmin + bbox.width) * w, (bbox.ymin + bbox.height) * h])
+        scores.append(det.score[0])
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4), np.array(scores, dtype=np.float32), None
+
+
+def capture_frames(cap):
+    """Capture stage: yield BGR frames from the stream (runs in its own thread)."""
+    while True:
+        ret, img = cap.read()
+        if not ret:
+            print("[WARNING] Failed to grab frame, retrying...")
+            continue
+        yield img
 
-    # Mediapipe 초기화
-    print("[INFO] Initializing Mediapipe...")
-    detector = mp_face.FaceDetection(
+
+def load_models():
+    """Mediapipe import + graph init + one dummy frame (runs while the stream opens)."""
+    import mediapipe as mp
+
+    detector = mp.solutions.face_detection.FaceDetection(
         model_selection=0,
         min_detection_confidence=0.5
     )
-    mesh = mp_mesh.FaceMesh(
+    mesh = mp.solutions.face_mesh.FaceMesh(
         max_num_faces=1,
         refine_landmarks=True,
         min_detection_confidence=0.5,
         min_tracking_confidence=0.5,
     )
-    print("[INFO] Mediapipe initialized")
+
+    blank = np.zeros((360, 640, 3), dtype=np.uint8)
+    detector.process(blank)
+    mesh.process(blank)
+    return detector, mesh
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Face Recognition - OpenCV + Mediapipe")
+    parser.add_argument("--ip", default=None, help="Camera IP")
+    parser.add_argument("--user", default="admin", help="Username")
+    parser.add_argument("--password", default="Sunap1!!", help="Password")
+    parser.add_argument("--stride", type=int, default=2, help="Initial detection interval (frames), adapted at runtime")
+    parser.add_argument("--budget", type=float, default=200, help="Latency budget in ms")
+    parser.add_argument("--motion_sensitivity", type=float, default=0.5,
+                        help="Motion gate sensitivity 0..1 (negative = detect without gating)")
+    parser.add_argument("--refresh", type=float, default=2.0, help="Forced full-frame detection every N seconds")
+    parser.add_argument("--no_roi", action="store_true",
+                        help="Detect only on the 640x360 frame (no full-resolution crops around tracked faces)")
+    parser.add_argument("--roi_pad", type=float, default=0.6, help="ROI margin around a tracked face, in face sizes")
+    parser.add_argument("--display_width", type=int, default=1280)
+    parser.add_argument("--display_height", type=int, default=720)
+    parser.add_argument("--headless", action="store_true", help="Run without display")
+    parser.add_argument("--source", default=None,
+                        help="Recorded input instead of the camera: .pcap (RTP), .h264 (Annex-B) or a video file")
+    parser.add_argument("--unpaced", action="store_true",
+                        help="Replay --source as fast as possible (default: real time)")
+    parser.add_argument("--loop", action="store_true", help="Restart --source at the end")
+    args = parser.parse_args(argv)
+    if not args.ip and not args.source:
+        parser.error("--ip or --source is required")
 
     # RTSP URL 구성
     rtsp_url = f"rtsp://{args.user}:{args.password}@{args.ip}/profile2/media.smp"
-    print(f"[INFO] Connecting to: {rtsp_url}")
-
-    # OpenCV VideoCapture로 RTSP 연결
-    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
-    
-    # 버퍼 설정 (지연 최소화)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-    
+
+    # Mediapipe 초기화는 RTSP 연결과 동시에 (background thread)
+    print("[INFO] Initializing Mediapipe...")
+    if args.source:
+        print(f"[INFO] Replaying: {args.source} ({'unpaced' if args.unpaced else 'real time'})")
+    else:
+        print(f"[INFO] Connecting to: {rtsp_url}")
+    cap = source = None
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        models = pool.submit(load_models)
+
+        if args.source:
+            # Offline replay: pcap / Annex-B / video file, no camera needed
+            source = open_source(args.source, paced=not args.unpaced, loop=args.loop)
+        else:
+            # OpenCV VideoCapture로 RTSP 연결 (끊기면 backoff 후 재연결)
+            cap = ReconnectingCapture(rtsp_url)
+            startup.log_step("RTSP open finished")
+
+            # 버퍼 설정 (지연 최소화)
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        detector, mesh = models.result()
+    startup.log_step("Mediapipe initialized")
+
     # 연결 확인
-    if not cap.isOpened():
+    if cap is not None and not cap.isOpened():
         print("[ERROR] Failed to open RTSP stream")
         print("[ERROR] Check IP, username, password, and network connection")
         return
@@ -84,107 +126,176 @@ def main():
     print("[INFO] Press ESC to exit (if display enabled)")
 
     frame_count = 0
-    last_faces = []
     face_detected_count = 0
 
-    while True:
-        ret, img = cap.read()
-        if not ret:
-            print("[WARNING] Failed to grab frame, retrying...")
-            continue
-
+    # Boxes carried between detections
+    tracker = FaceTracker()
+
+    # Every frame: detector on full-resolution crops around the tracked faces.
+    # The 640x360 pass below only has to find new faces.
+    roi_detector = None
+    if not args.no_roi:
+        roi_detector = ROIDetector(
+            lambda crop: detect_boxes(detector, cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)),
+            pad=args.roi_pad,
+        )
+
+    # Detection interval follows detector latency, queue lag and face motion
+    scheduler = AdaptiveScheduler(interval=args.stride, budget=args.budget / 1000.0)
+
+    # Detector only sees moving regions of the 640x360 frame (+ periodic full frame)
+    gate = None
+    if args.motion_sensitivity >= 0:
+        gate = MotionGate(sensitivity=args.motion_sensitivity, refresh=args.refresh)
+
+    # FaceMesh (max_num_faces=1, refine_landmarks=True): 478 points, copied without per-point lists
+    landmark_buf = LandmarkBuffer(max_faces=1, n_points=478)
+
+    # Detect stage: low-res sweep on the frames the scheduler picks + ROI crops + tracking
+    def detect(item):
+        nonlocal frame_count, face_detected_count
+        captured_at, img = item
         h, w = img.shape[:2]
 
         # 1) Downscale for detection
         small_w, small_h = 640, 360
         small = cv2.resize(img, (small_w, small_h))
 
-        # 2) Detection every N frames
-        if frame_count % args.stride == 0:
-            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-            det_result = detector.process(rgb_small)
-
-            faces = []
-            if det_result.detections:
-                for det in det_result.detections:
-                    bbox = det.location_data.relative_bounding_box
-
-                    xs = int(bbox.xmin * small_w)
-                    ys = int(bbox.ymin * small_h)
-                    xe = int((bbox.xmin + bbox.width) * small_w)
-                    ye = int((bbox.ymin + bbox.height) * small_h)
+        # 2) Low-res sweep on the frames the scheduler picks, only where something moved
+        regions = None
+        if scheduler.should_detect(lag=time.monotonic() - captured_at):
+            regions = gate.update(small) if gate is not None else [(0, 0, small_w, small_h)]
+            if not regions:
+                scheduler.skip(len(tracker.tracks))   # nothing moved: static / idle scene
 
-                    # Scale back to original
-                    X1 = int(xs * (w / small_w))
-                    Y1 = int(ys * (h / small_h))
-                    X2 = int(xe * (w / small_w))
-                    Y2 = int(ye * (h / small_h))
-
-                    faces.append((X1, Y1, X2, Y2))
+        start = time.perf_counter()
+        sweep = None
+        if regions:
+            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            sx, sy = w / small_w, h / small_h
+            boxes, scores = [np.zeros((0, 4), np.float32)], [np.zeros(0, np.float32)]
+            for (rx1, ry1, rx2, ry2) in regions:
+                b, sc, _ = detect_boxes(detector, rgb_small[ry1:ry2, rx1:rx2])
+                boxes.append((b + [rx1, ry1, rx1, ry1]) * [sx, sy, sx, sy])
+                scores.append(sc)
+
+            if roi_detector is None:
+                # Faces outside the moving regions stay where they were
+                for t in tracker.tracks:
+                    x1, y1, x2, y2 = t.bbox
+                    if not any(x1 < rx2 * sx and rx1 * sx < x2 and y1 < ry2 * sy and ry1 * sy < y2
+                               for (rx1, ry1, rx2, ry2) in regions):
+                        boxes.append(t.bbox[None])
+                        scores.append(np.array([t.score], np.float32))
+            sweep = (np.concatenate(boxes).astype(np.float32), np.concatenate(scores), None)
+
+        # 3) Full-resolution crops around the tracked faces (every frame) + sweep merge
+        if roi_detector is not None and (sweep is not None or tracker.tracks):
+            boxes, scores, _ = roi_detector.detect(img, tracker.predicted_boxes(), sweep)
+        elif sweep is not None:
+            boxes, scores, _ = sweep
+        else:
+            boxes = None
 
-            last_faces = faces
+        if boxes is not None:
+            tracks = tracker.update(boxes, scores)
+            if sweep is not None:
+                scheduler.record(time.perf_counter() - start, boxes)
         else:
-            faces = last_faces
+            tracks = tracker.predict()
+        faces = [tuple(int(v) for v in np.clip(t.bbox, 0, [w, h, w, h])) for t in tracks]
 
         frame_count += 1
+        if faces:
+            face_detected_count += 1
+        return img, faces
 
-        # 3) FaceMesh Landmark + Alignment
-        aligned_preview = None
+    # Landmark stage: FaceMesh on the first face -> 5 points -> aligned 112x112 crop
+    def landmark(item):
+        img, faces = item
+        landmarks_5 = aligned_preview = None
 
-        if len(faces) > 0:
-            face_detected_count += 1
+        if faces:
             x1, y1, x2, y2 = faces[0]
-
             face_roi = img[y1:y2, x1:x2]
             if face_roi.size != 0:
                 face_rgb = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
                 mesh_result = mesh.process(face_rgb)
 
                 if mesh_result.multi_face_landmarks:
-                    lm = mesh_result.multi_face_landmarks[0].landmark
-
-                    landmarks_5 = []
-                    idxs = FACEMESH_LANDMARK_IDXS
-
-                    for key in ["left_eye", "right_eye", "nose", "mouth_left", "mouth_right"]:
-                        i = idxs[key]
-                        lx = lm[i].x * (x2 - x1) + x1
-                        ly = lm[i].y * (y2 - y1) + y1
-                        landmarks_5.append([lx, ly])
-
-                    landmarks_5 = np.array(landmarks_5, dtype=np.float32)
+                    pts = landmark_buf.fill([f.landmark for f in mesh_result.multi_face_landmarks])
+                    landmarks_5 = five_points(pts, x2 - x1, y2 - y1, origin=(x1, y1))[0]
                     aligned_preview = align_face(img, landmarks_5)
-
-                    # Draw landmarks
-                    for (lx, ly) in landmarks_5:
-                        cv2.circle(img, (int(lx), int(ly)), 3, (0, 255, 255), -1)
-
-        # 4) Draw bounding boxes
-        for (x1, y1, x2, y2) in faces:
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-        # 5) 통계 출력
-        if frame_count % 100 == 0:
-            print(f"[INFO] Processed {frame_count} frames, {face_detected_count} faces detected")
-
-        # 6) Display (headless 모드가 아닐 때만)
+        return img, faces, landmarks_5, aligned_preview
+
+    # capture -> detect -> landmark run in worker threads, the sink (draw/display) here
+    pipeline = Pipeline()
+    if source is not None:
+        # Unpaced replay: block instead of dropping, so every recorded frame is processed
+        frames = ((time.monotonic(), img) for _, img in source)
+        pipeline.add_source("capture", frames, maxsize=1, policy="block" if args.unpaced else "latest")
+    else:
+        frames = ((time.monotonic(), img) for img in capture_frames(cap))
+        pipeline.add_source("capture", frames, maxsize=1, policy="latest")
+    pipeline.add_stage("detect", detect, maxsize=2, policy="block")
+    pipeline.add_stage("landmark", landmark, maxsize=2, policy="latest")
+    pipeline.start()
+
+    shown = 0
+    try:
+        for result in pipeline.results():
+            if result is None:
+                if not args.headless:
+                    cv2.waitKey(1)
+                continue
+
+            img, faces, landmarks_5, aligned_preview = result
+            shown += 1
+            if shown == 1:
+                startup.mark_ready("first frame processed")
+
+            # 4) Draw landmarks + bounding boxes
+            if landmarks_5 is not None:
+                for (lx, ly) in landmarks_5:
+                    cv2.circle(img, (int(lx), int(ly)), 3, (0, 255, 255), -1)
+            for (x1, y1, x2, y2) in faces:
+                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+            # 5) 통계 출력
+            if shown % 100 == 0:
+                print(f"[INFO] Processed {frame_count} frames, {face_detected_count} faces detected")
+                print(f"[INFO] {pipeline.format_stats()}")
+                print(f"[INFO] Scheduler: {scheduler.format_stats()}")
+                if gate is not None:
+                    print(f"[INFO] Motion gate: {gate.stats['pass_rate'] * 100:.0f}% of checked frames detected")
+                if roi_detector is not None:
+                    print(f"[INFO] ROI detection: {roi_detector.stats}")
+
+            # 6) Display (headless 모드가 아닐 때만)
+            if not args.headless:
+                display_img = cv2.resize(img, (args.display_width, args.display_height))
+                cv2.imshow("Face Detection - Mediapipe", display_img)
+
+                if aligned_preview is not None:
+                    cv2.imshow("Aligned Face (112x112)", aligned_preview)
+
+                key = cv2.waitKey(1)
+                if key == 27:  # ESC
+                    print("[INFO] ESC pressed, exiting...")
+                    break
+        else:
+            if source is not None:
+                print("[INFO] End of source")
+    finally:
+        pipeline.stop()
+        if cap is not None:
+            cap.release()
         if not args.headless:
-            display_img = cv2.resize(img, (args.display_width, args.display_height))
-            cv2.imshow("Face Detection - Mediapipe", display_img)
-
-            if aligned_preview is not None:
-                cv2.imshow("Aligned Face (112x112)", aligned_preview)
-
-            key = cv2.waitKey(1)
-            if key == 27:  # ESC
-                print("[INFO] ESC pressed, exiting...")
-                break
+            cv2.destroyAllWindows()
 
-    cap.release()
-    if not args.headless:
-        cv2.destroyAllWindows()
-    
     print(f"[INFO] Total frames: {frame_count}, Faces detected: {face_detected_count}")
+    if source is not None:
+        print(f"[INFO] Source: {source.stats}")
 
 
 if __name__ == "__main__":
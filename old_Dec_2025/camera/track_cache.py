@@ -0,0 +1,160 @@
+# camera/track_cache.py
+#
+# Per-track embedding templates with a hard memory cap.
+#
+# Every track accumulates a quality-weighted mean of its L2-normalized
+# embeddings. The gallery is queried with that template (less noisy than a
+# single frame), and only when it moved by more than `min_change` cosine
+# distance since the last query. Rows live in preallocated arrays; entries
+# are evicted by TTL (track gone) or LRU (cache full).
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gallery import l2_normalize
+
+
+def face_quality(det_score, bbox, full_size=112.0):
+    """Detector confidence, scaled down for faces smaller than the 112 px crop."""
+    width = float(bbox[2] - bbox[0])
+    return float(det_score) * min(1.0, max(width, 1.0) / full_size)
+
+
+class TrackEmbeddingCache:
+    def __init__(self, dim=512, capacity=256, ttl=10.0, min_change=0.02):
+        """
+        capacity:   tracks held at once (memory = capacity x dim x 4 bytes x 3)
+        ttl:        seconds after the last embedding before a track is dropped
+        min_change: cosine distance the template must move to query again
+        """
+        self.dim = dim
+        self.capacity = capacity
+        self.ttl = ttl
+        self.min_change = min_change
+
+        self.sums = np.zeros((capacity, dim), dtype=np.float32)       # sum of quality * emb
+        self.templates = np.zeros((capacity, dim), dtype=np.float32)  # normalized mean
+        self.queried = np.zeros((capacity, dim), dtype=np.float32)    # template at last query
+        self.weights = np.zeros(capacity, dtype=np.float32)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.stamps = np.zeros(capacity, dtype=np.float64)
+        self.has_result = np.zeros(capacity, dtype=bool)
+        self.names = np.empty(capacity, dtype=object)
+        self.scores = np.zeros(capacity, dtype=np.float32)
+
+        self.rows = OrderedDict()   # track_id -> row, least recently used first
+        self.free = list(range(capacity - 1, -1, -1))
+
+        self.queries = 0
+        self.skipped = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, track_id):
+        return track_id in self.rows
+
+    # -------------------------------------------
+    # Rows
+    # -------------------------------------------
+    def _row(self, track_id):
+        row = self.rows.get(track_id)
+        if row is not None:
+            self.rows.move_to_end(track_id)
+            return row
+
+        if not self.free:
+            _, old = self.rows.popitem(last=False)   # LRU
+            self.free.append(old)
+            self.evicted += 1
+
+        row = self.free.pop()
+        self.sums[row] = 0.0
+        self.weights[row] = 0.0
+        self.counts[row] = 0
+        self.has_result[row] = False
+        self.names[row] = None
+        self.rows[track_id] = row
+        return row
+
+    def remove(self, track_id):
+        row = self.rows.pop(track_id, None)
+        if row is not None:
+            self.free.append(row)
+
+    def evict_expired(self, now=None):
+        """Drop tracks that got no embedding for `ttl` seconds."""
+        now = time.monotonic() if now is None else now
+        expired = [tid for tid, row in self.rows.items() if now - self.stamps[row] > self.ttl]
+        for tid in expired:
+            self.remove(tid)
+        self.evicted += len(expired)
+        return len(expired)
+
+    # -------------------------------------------
+    # Templates
+    # -------------------------------------------
+    def add(self, track_id, emb, quality=1.0):
+        """Fold one embedding into the track's template."""
+        row = self._row(track_id)
+        quality = max(float(quality), 1e-3)
+        self.sums[row] += quality * l2_normalize(emb)
+        self.weights[row] += quality
+        self.counts[row] += 1
+        self.templates[row] = l2_normalize(self.sums[row])
+        self.stamps[row] = time.monotonic()
+        return row
+
+    def template(self, track_id):
+        row = self.rows.get(track_id)
+        return None if row is None else self.templates[row]
+
+    def needs_query(self, track_id):
+        row = self.rows.get(track_id)
+        if row is None:
+            return False
+        if not self.has_result[row]:
+            return True
+        return 1.0 - float(self.templates[row] @ self.queried[row]) > self.min_change
+
+    def result(self, track_id):
+        """(name, score) of the last gallery query, or None."""
+        row = self.rows.get(track_id)
+        if row is None or not self.has_result[row]:
+            return None
+        return self.names[row], float(self.scores[row])
+
+    def recognize(self, gallery, track_ids, threshold=0.65):
+        """
+        Query the gallery with the templates of `track_ids` that moved (one
+        batched search), keep the rest.
+        return: {track_id: (name, score)}
+        """
+        todo = [tid for tid in track_ids if self.needs_query(tid)]
+        self.skipped += sum(1 for tid in track_ids if tid in self.rows) - len(todo)
+
+        if todo:
+            rows = np.array([self.rows[tid] for tid in todo])
+            names, scores = gallery.search(self.templates[rows], k=1)
+            for row, n, s in zip(rows, names, scores):
+                best = float(s[0]) if len(s) else 0.0
+                self.names[row] = n[0] if len(n) and best >= threshold else "Unknown"
+                self.scores[row] = best
+                self.has_result[row] = True
+                self.queried[row] = self.templates[row]
+            self.queries += len(todo)
+
+        return {tid: self.result(tid) for tid in track_ids if tid in self.rows}
+
+    @property
+    def stats(self):
+        return {
+            "tracks": len(self.rows),
+            "capacity": self.capacity,
+            "queries": self.queries,
+            "skipped": self.skipped,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,229 @@
+# camera/tracker.py
+#
+# SORT-style multi-face tracker: constant-velocity Kalman filter per track,
+# greedy IoU association. Gives every face a stable track ID so recognition
+# runs once per track (plus re-verification), not once per frame.
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """(n, 4) x (m, 4) boxes (x1, y1, x2, y2) -> (n, m) IoU."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def greedy_match(iou, threshold):
+    """Pairs (row, col) by descending IoU, each row/col used once (no scipy)."""
+    if iou.size == 0:
+        return []
+
+    order = np.argsort(iou, axis=None)[::-1]
+    rows, cols = np.unravel_index(order, iou.shape)
+    used_r, used_c = set(), set()
+    pairs = []
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        if iou[r, c] < threshold:
+            break
+        if r in used_r or c in used_c:
+            continue
+        used_r.add(r)
+        used_c.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+# -------------------------------------------
+# Kalman filter (state: cx, cy, area, aspect, vx, vy, v_area)
+# -------------------------------------------
+_F = np.eye(7, dtype=np.float64)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7, dtype=np.float64)
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+
+
+def box_to_z(box):
+    x1, y1, x2, y2 = box[:4]
+    w, h = max(x2 - x1, 1.0), max(y2 - y1, 1.0)
+    return np.array([x1 + w / 2, y1 + h / 2, w * h, w / h], dtype=np.float64)
+
+
+def x_to_box(x):
+    w = np.sqrt(max(x[2] * x[3], 1.0))
+    h = max(x[2], 1.0) / w
+    return np.array([x[0] - w / 2, x[1] - h / 2, x[0] + w / 2, x[1] + h / 2], dtype=np.float32)
+
+
+class Track:
+    def __init__(self, track_id, box, score):
+        self.id = track_id
+        self.x = np.zeros(7)
+        self.x[:4] = box_to_z(box)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+        self.bbox = np.asarray(box[:4], dtype=np.float32)
+        self.score = score            # detector confidence of the last match
+        self.hits = 1
+        self.misses = 0               # frames since the last matched detection
+        self.det_index = -1           # detection matched in the current frame (-1 = predicted)
+
+        # Recognition state, carried forward between verifications
+        self.label = None
+        self.similarity = None
+        self.verified_frame = None
+        self.verified_score = None
+
+    def predict(self):
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0
+        self.x = _F @ self.x
+        self.P = _F @ self.P @ _F.T + _Q
+        self.bbox = x_to_box(self.x)
+
+    def update(self, box, score):
+        y = box_to_z(box) - _H @ self.x
+        S = _H @ self.P @ _H.T + _R
+        K = self.P @ _H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ _H) @ self.P
+        self.bbox = np.asarray(box[:4], dtype=np.float32)
+        self.score = score
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def velocity(self):
+        """Center speed in box widths per frame."""
+        w = max(float(self.bbox[2] - self.bbox[0]), 1.0)
+        return float(np.hypot(self.x[4], self.x[5])) / w
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_misses=15, min_hits=1,
+                 reverify_every=30, score_change=0.15):
+        """
+        max_misses:     frames a track survives without a matched detection
+                        (detection frames that missed it and predict-only frames)
+        min_hits:       matched detections before a track is reported
+        reverify_every: frames between re-running recognition on a track
+        score_change:   detector confidence change that triggers recognition
+        """
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.reverify_every = reverify_every
+        self.score_change = score_change
+
+        self.tracks = []
+        self.next_id = 1
+        self.frame = 0
+        self.recognitions = 0   # recognition requests handed out
+
+    def _active(self):
+        return [t for t in self.tracks if t.hits >= self.min_hits]
+
+    def predict(self):
+        """
+        Frame without detection: move every track along its velocity. Coasting
+        ages tracks too, so a face that left while detection was skipped does
+        not keep its box and label until the next detection.
+        """
+        self.frame += 1
+        for t in self.tracks:
+            t.predict()
+            t.det_index = -1
+            t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        return self._active()
+
+    def update(self, boxes, scores=None):
+        """
+        Frame with detection.
+        boxes:  (n, 4) x1, y1, x2, y2 (extra columns are ignored)
+        scores: (n,) detector confidence (optional)
+        return: reported tracks; track.det_index links to the matched box
+        """
+        self.frame += 1
+        boxes = np.asarray(boxes, dtype=np.float32)
+        boxes = boxes.reshape(len(boxes), -1)[:, :4] if len(boxes) else np.zeros((0, 4), np.float32)
+        if scores is None:
+            scores = np.ones(len(boxes), dtype=np.float32)
+
+        for t in self.tracks:
+            t.predict()
+            t.det_index = -1
+
+        predicted = np.array([t.bbox for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        pairs = greedy_match(iou_matrix(predicted, boxes), self.iou_threshold)
+
+        matched = set()
+        for r, c in pairs:
+            self.tracks[r].update(boxes[c], float(scores[c]))
+            self.tracks[r].det_index = c
+            matched.add(c)
+
+        for c in range(len(boxes)):
+            if c not in matched:
+                t = Track(self.next_id, boxes[c], float(scores[c]))
+                t.det_index = c
+                self.next_id += 1
+                self.tracks.append(t)
+
+        for t in self.tracks:
+            if t.det_index < 0:
+                t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        return self._active()
+
+    def predicted_boxes(self):
+        """Where the tracks are expected in the next frame (state is not advanced)."""
+        boxes = [x_to_box(_F @ t.x) for t in self.tracks]
+        return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+    def needs_recognition(self, track):
+        """New track, changed detector confidence or re-verify interval expired."""
+        if track.det_index < 0:
+            return False   # no fresh detection (landmarks / crop) this frame
+        if track.verified_frame is None:
+            return True
+        if abs(track.score - track.verified_score) >= self.score_change:
+            return True
+        return self.frame - track.verified_frame >= self.reverify_every
+
+    def pending(self, tracks):
+        """
+        Tracks to embed + match this frame. They are marked verified right
+        away so a slower recognition stage is not asked twice.
+        """
+        out = [t for t in tracks if self.needs_recognition(t)]
+        for t in out:
+            t.verified_frame = self.frame
+            t.verified_score = t.score
+        self.recognitions += len(out)
+        return out
+
+    @staticmethod
+    def set_label(track, name, similarity=None):
+        track.label = name
+        track.similarity = similarity
+
+    @property
+    def stats(self):
+        return {
+            "tracks": len(self.tracks),
+            "next_id": self.next_id,
+            "frames": self.frame,
+            "recognitions": self.recognitions,
+        }
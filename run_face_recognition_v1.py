@@ -1,10 +1,19 @@
+import os
+import sys
+
 import cv2
 import numpy as np
 import mediapipe as mp
 
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
-from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "old_Dec_2025", "camera"))
+from gallery import EmbeddingGallery
+from gallery_store import GalleryFile
+from landmarks import LandmarkBuffer, bboxes, embeddings
+from pipeline import Pipeline
+from tracker import FaceTracker
 
 
 # ======================================================
@@ -25,33 +34,30 @@ options = FaceLandmarkerOptions(
 
 landmarker = FaceLandmarker.create_from_options(options)
 
+# (num_faces, 478, 3) float32, reused every frame
+landmark_buffer = LandmarkBuffer(max_faces=options.num_faces, n_points=478)
+
 
 # ======================================================
 # 2) Embedding DB (임시)
 # ======================================================
-embedding_db = {}   # {"Name": vector}
-
+EMBEDDING_DIM = 478 * 3
+GALLERY_PATH = os.getenv("GALLERY_PATH")  # memory-mapped gallery file (optional)
 
-def compute_embedding(landmarks_result):
-    if len(landmarks_result.face_landmarks) == 0:
-        return None
+if GALLERY_PATH:
+    embedding_db = GalleryFile(GALLERY_PATH)
+else:
+    embedding_db = EmbeddingGallery(dim=EMBEDDING_DIM)   # name -> L2-normalized vector
 
-    lmks = landmarks_result.face_landmarks[0]
-    arr = np.array([[p.x, p.y, p.z] for p in lmks]).flatten()
-    return arr
 
+def compute_embeddings(pts):
+    """(n_faces, 478, 3) landmarks -> (n_faces, 478 * 3) embeddings (view)."""
+    return embeddings(pts)
 
-def match_face(emb, threshold=0.65):
-    if not embedding_db:
-        return "Unknown"
 
-    names = list(embedding_db.keys())
-    vecs = np.array(list(embedding_db.values()))
-
-    sims = cosine_similarity([emb], vecs)[0]
-    idx = np.argmax(sims)
-
-    return names[idx] if sims[idx] >= threshold else "Unknown"
+def match_faces(embs, threshold=0.65):
+    """One gallery search for every face in the frame."""
+    return embedding_db.match_many(embs, threshold)
 
 
 # ======================================================
@@ -65,18 +71,27 @@ if not cap.isOpened():
     raise RuntimeError("Failed to open RTSP stream. Check camera IP / credentials.")
 
 
+# Stable IDs across frames: embed + match only new / re-verified tracks
+tracker = FaceTracker(reverify_every=int(os.getenv("REVERIFY_EVERY", "30")))
+
 print("Running Face Recognition v2 ...")
 
 
+def capture_frames():
+    """Capture stage: yield frames from the stream (runs in its own thread)."""
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            print("Frame read failed")
+            continue
+        yield frame
+
+
 # ======================================================
-# 4) Main Loop
+# 4) Pipeline stages
 # ======================================================
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Frame read failed")
-        continue
-
+def detect(frame):
+    """Landmarks -> boxes -> tracks; embeddings only for tracks that need recognition."""
     rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
     # Mediapipe는 mp.Image 객체를 입력으로 받는다
@@ -84,29 +99,58 @@ while True:
 
     # Landmarks detection
     landmarks_result = landmarker.detect(mp_image)
-    embedding = compute_embedding(landmarks_result)
+    pts = landmark_buffer.fill(landmarks_result.face_landmarks)
 
-    if embedding is not None:
-        name = match_face(embedding)
-        # bounding box는 mediapipe tasks API에서 직접 제공됨
-        lmks = landmarks_result.face_landmarks[0]
-        xs = [p.x for p in lmks]
-        ys = [p.y for p in lmks]
-        h, w, _ = frame.shape
-        x1 = int(min(xs) * w)
-        y1 = int(min(ys) * h)
-        x2 = int(max(xs) * w)
-        y2 = int(max(ys) * h)
+    # bounding box는 landmark 버퍼에서 NumPy reduction으로 계산
+    h, w, _ = frame.shape
+    tracks = tracker.update(bboxes(pts, w, h))
 
-        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        cv2.putText(frame, name, (x1, y1 - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+    # New tracks / expired re-verify interval. Fancy indexing copies the rows,
+    # so the buffer can be refilled while the recognize stage still uses them.
+    pending = tracker.pending(tracks)
+    embs = compute_embeddings(pts[[t.det_index for t in pending]]) if pending else None
 
-    cv2.imshow("Face Recognition - Mediapipe v2", frame)
+    boxes = [(t, t.bbox.copy()) for t in tracks]
+    return frame, boxes, pending, embs
 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
 
+def recognize(item):
+    """One gallery search for the pending tracks; labels are carried forward by the tracker."""
+    frame, boxes, pending, embs = item
+    if pending:
+        names = match_faces(embs)
+        for t, name in zip(pending, names):
+            tracker.set_label(t, name)
+    return frame, boxes
 
-cap.release()
-cv2.destroyAllWindows()
+
+# ======================================================
+# 5) Main Loop (capture -> detect -> recognize in worker threads, display here)
+# ======================================================
+pipeline = Pipeline()
+pipeline.add_source("capture", capture_frames(), maxsize=1, policy="latest")
+pipeline.add_stage("detect", detect, maxsize=2, policy="block")
+pipeline.add_stage("recognize", recognize, maxsize=2, policy="latest")
+pipeline.start()
+
+try:
+    for result in pipeline.results():
+        if result is None:
+            cv2.waitKey(1)
+            continue
+
+        frame, boxes = result
+        for t, bbox in boxes:
+            x1, y1, x2, y2 = bbox.astype(int).tolist()
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"#{t.id} {t.label}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+
+        cv2.imshow("Face Recognition - Mediapipe v2", frame)
+
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+finally:
+    pipeline.stop()
+    cap.release()
+    cv2.destroyAllWindows()